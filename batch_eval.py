@@ -0,0 +1,94 @@
+"""
+batch_eval.py
+Vectorized evaluation of every child of a node in one numpy pass
+
+Used by nega_max at depth 1 (search.BATCH_EVAL): instead of evaluate_board in each child's quiesce, the children
+are encoded as an (N, 40) array of piece codes and their stand pats scored together. The result is the same number
+evaluate_board would give for each child, so alpha-beta sees exactly the same values.
+
+Attacks are table lookups, REACH gives the captures a piece could make from each square and a slider
+only gets them if the squares BETWEEN are empty (one matrix multiply against the occupancy).
+
+Piece codes are zobrist_id + 1 (0 = empty): 1 bp, 2 wp, 3 wk, 4 wn, 5 wb, 6 wr
+The evaluation per piece (piece.py): 0 if something can capture it, else value + # of captures it can make,
+black pieces count negative.
+"""
+
+import numpy as np
+from piece import PIECE_VALUES
+from bitboard import iter_bits, SQ_RC, STEP_ATTACKS, BISHOP_RAYS, ROOK_RAYS
+from moves import SQ_MASK, TO_SHIFT, PROMO_SHIFT, PROMO_MASK, ENPASSANT_CAP
+
+ROWS, COLS = 8, 5
+NUM_SQUARES = ROWS * COLS
+
+EMPTY, BP, WP, WK, WN, WB, WR = 0, 1, 2, 3, 4, 5, 6
+CODE_VALUES = np.array([0] + PIECE_VALUES, dtype=np.int16)
+# promotion code (1 = rook, 2 = knight, 3 = king, 4 = bishop) to piece code
+PROMOTION_CODES = np.array([0, WR, WN, WK, WB], dtype=np.int8)
+
+def _tables():
+    # REACH[code][s][t]: # of captures a piece of this code on s makes on t if t holds an enemy
+    # (the black col 0 quirk and the 4 promotions of a white pawn on row 1 are in the pawn tables)
+    # BETWEEN[s * 40 + t][b]: b is strictly between s and t on a line, a slider can't reach t if b is occupied
+    reach = np.zeros((WR + 1, NUM_SQUARES, NUM_SQUARES), dtype=np.int8)
+    between = np.zeros((NUM_SQUARES, NUM_SQUARES, NUM_SQUARES), dtype=np.float32)
+    for zobrist_id in range(len(STEP_ATTACKS)):
+        for s in range(NUM_SQUARES):
+            for t in iter_bits(STEP_ATTACKS[zobrist_id][s]):
+                reach[zobrist_id + 1][s][t] = 4 if zobrist_id == 1 and SQ_RC[s][0] == 1 else 1
+    for (code, rays) in ((WB, BISHOP_RAYS), (WR, ROOK_RAYS)):
+        for s in range(NUM_SQUARES):
+            for (table, positive) in rays:
+                ray = list(iter_bits(table[s]))
+                if not positive:
+                    ray.reverse() # walk away from s
+                for i, t in enumerate(ray):
+                    reach[code][s][t] = 1
+                    between[s][t][ray[:i]] = 1
+    return reach, between.reshape(NUM_SQUARES * NUM_SQUARES, NUM_SQUARES).T.copy()
+
+REACH, BETWEEN = _tables()
+SQUARES = np.arange(NUM_SQUARES)
+
+def encode_board(bb) -> np.ndarray:
+    # piece codes of the current position from the per type bitboards, flat (40,)
+    codes = np.zeros(NUM_SQUARES, dtype=np.int8)
+    for zobrist_id in range(6):
+        for sq in iter_bits(bb[zobrist_id]):
+            codes[sq] = zobrist_id + 1
+    return codes
+
+def encode_children(parent: np.ndarray, mvs) -> np.ndarray:
+    # (N, 40) codes of the positions after each move (a list of packed moves) from the parent codes
+    mvs = np.asarray(mvs, dtype=np.int64)
+    n = len(mvs)
+    rows = np.arange(n)
+    frm = mvs & SQ_MASK
+    to = (mvs >> TO_SHIFT) & SQ_MASK
+    promotion = (mvs >> PROMO_SHIFT) & PROMO_MASK
+    children = np.repeat(parent[None, :], n, axis=0)
+    moved = np.where(promotion > 0, PROMOTION_CODES[promotion], children[rows, frm])
+    children[rows, frm] = EMPTY
+    children[rows, to] = moved
+    # enpassant capture takes the pawn one row above the end square
+    ep = np.nonzero(mvs & ENPASSANT_CAP)[0]
+    children[ep, to[ep] - COLS] = EMPTY
+    return children
+
+def evaluate_batch(codes: np.ndarray) -> np.ndarray:
+    # evaluate_board for each row of codes (N, 40), positive is good for white
+    # enpassant captures are not included, the caller has to evaluate those positions itself
+    n = len(codes)
+    occupied = (codes != EMPTY).astype(np.float32)
+    clear = ((occupied @ BETWEEN) == 0).reshape(n, NUM_SQUARES, NUM_SQUARES)
+    white = codes >= WP
+    black = codes == BP
+    # [n][s][t]: the piece on s and the piece on t are different colors
+    enemy = np.where(white[:, :, None], black[:, None, :], black[:, :, None] & white[:, None, :])
+    captures = REACH[codes, SQUARES] * (enemy & clear) # [n][attacker square][target square]
+
+    cap_counts = captures.sum(axis=2, dtype=np.int16)
+    attacked = captures.any(axis=1)
+    scores = np.where(attacked, 0, CODE_VALUES[codes] + cap_counts)
+    return (scores * (white.astype(np.int8) - black)).sum(axis=1)
@@ -0,0 +1,185 @@
+"""
+bench.py
+Search benchmark, a fixed set of positions searched the same way every run so engine versions can be compared
+
+Usage: python3 bench.py [-d DEPTH] [-t SECONDS] [-n RUNS] [-o results.json] [-b [baseline.json]] [--threshold 0.1]
+                        [--time-threshold 0.1]
+
+For every position:
+1. nega_max_root at depth 1, 2, ... DEPTH (iterative deepening, hash move first) from a clean state:
+   nodes, nodes per second, time to each depth and the effective branching factor, the fastest of RUNS runs
+2. positions with an expected move are searched again with iterative_deepening and a SECONDS budget,
+   solved if the move played is one of the expected moves
+
+Results are written as json, with -b they are compared against an older results file (bench_baseline.json if no
+file is given, regenerate it with -o bench_baseline.json when a change is on purpose). A position needing more than
+threshold more nodes or fewer positions solved is a regression (exit code 1), both are the same every run.
+Time is only checked with --time-threshold: total nps more than that below the baseline's is a regression, but only
+against a baseline written on this machine (results keep the machine they ran on, other baselines are skipped).
+The fastest of -n runs takes out one-off stalls, but on a shared or busy machine the speed itself drifts 20% or more
+from one minute to the next, which is why time isn't checked by default. Pick the threshold with that in mind.
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+import board as B
+import search as S
+import ordering
+from moves import move_str
+from zobrist_hashing import zobrist_load, TranspositionTable, tt_new_search
+
+BENCH_DEPTH = 6
+BENCH_TIME = 2.0 # seconds for the expected move
+BENCH_TT_MB = 16
+THRESHOLD = 0.1
+BENCH_BASELINE = 'bench_baseline.json'
+BENCH_RUNS = 3 # fixed depth runs a position when timing is checked, the fastest counts
+
+# name: (fill_board back rank or board string (board.board_to_str), expected moves (move_str) or None)
+# the 'win in' positions have exactly one move that wins that fast (and none that wins faster), checked with a plain
+# minimax without pruning, the search needs depth 8-12 and tens of thousands of nodes to see it, so a change that
+# costs the search a lot of nodes runs out of time and misses it
+POSITIONS = {
+    'start knrb': ('knrb ', None),
+    'start rbnk': ('rbnk ', None),
+    'start  bnrk': (' bnrk', None),
+    'start b rkn': ('b rkn', None),
+    'start nkr b': ('nkr b', None),
+    'middle 1': ('pp.pp/..p../...../...P./...../...../P.PP./KN.BR w', None),
+    'middle 2': ('ppppp/p.ppp/.p.../...../..N../...../PPPPP/K..BR w', None),
+    'middle 3': ('ppppp/.pppp/ppp.p/p..p./....P/.P.../P.PPN/RB.K. w', None),
+    'win in 9 knight takes': ('...../...../...B./...p./...../.ppPK/...../R..N. w', ['(8, 4) to (6, 3) [capture]']),
+    'win in 11 knight back': ('...../....p/.p.../..PK./...../...Np/P..../..... w', ['(6, 4) to (8, 3)']),
+    'win in 13 knight takes': ('...../..p../...../.p.../....p/....p/...../K..N. w', ['(8, 4) to (6, 5) [capture]']),
+    'end knight stops pawn': ('ppppp/...../...../...../...../...../..p../N...K w', ['(8, 1) to (7, 3) [capture]']),
+    'end king stops pawn': ('ppppp/...../...../...../...../...../..p../.K..R w', ['(8, 2) to (7, 3) [capture]', '(8, 2) to (8, 3)']),
+}
+
+def _setup(position: str) -> bool:
+    # load a position, returns the side to move
+    ordering.clear()
+    if '/' in position:
+        return B.load_board_str(position)
+    B.fill_board(white_back_rank=position)
+    return True
+
+def _fixed_depth(position: str, depth: int, zb) -> dict:
+    turn = _setup(position)
+    tt = TranspositionTable(size_mb=BENCH_TT_MB)
+    board_zb_hash = B.calculate_zb_hash(zb, turn)
+
+    # fixed depth, the same loop as iterative_deepening without the limits
+    result = {'nodes': [], 'time': [], 'score': None, 'move': None}
+    S.stats.reset()
+    ordering.new_search()
+    tt_new_search(tt)
+    best_mv = None
+    start = time.perf_counter()
+    for d in range(1, depth + 1):
+        mv = S.nega_max_root(prev_move=None, d=d, alpha=-1000, beta=1000, turn=turn, zb=zb, board_zb_hash=board_zb_hash, tt=tt, first_move=best_mv)
+        result['nodes'].append(S.stats.nodes)
+        result['time'].append(round(time.perf_counter() - start, 4))
+        if mv is None:
+            break
+        best_mv = mv
+        result['score'] = S.root_score
+        result['move'] = move_str(mv)
+    nodes = result['nodes'][-1]
+    elapsed = result['time'][-1]
+    result['nps'] = round(nodes / max(elapsed, 1e-9))
+    if len(result['nodes']) > 1:
+        result['ebf'] = round((nodes / max(result['nodes'][0], 1)) ** (1 / (len(result['nodes']) - 1)), 3)
+    else:
+        result['ebf'] = None
+    return result
+
+def bench_position(position: str, expected, depth: int, time_budget: float, zb, runs: int=1) -> dict:
+    # the nodes are the same every run, the fastest run's times are kept
+    result = min((_fixed_depth(position, depth, zb) for _ in range(runs)), key=lambda r: r['time'][-1])
+
+    if expected:
+        turn = _setup(position)
+        tt = TranspositionTable(size_mb=BENCH_TT_MB)
+        mv = S.iterative_deepening(prev_move=None, turn=turn, time_limit=time_budget, zb=zb, board_zb_hash=B.calculate_zb_hash(zb, turn), tt=tt)
+        result['played'] = move_str(mv) if mv else None
+        result['solved'] = result['played'] in expected
+    return result
+
+def machine() -> str:
+    return f"{platform.node()} {platform.machine()} {platform.processor()} python {platform.python_version()}"
+
+def run(depth: int=BENCH_DEPTH, time_budget: float=BENCH_TIME, runs: int=1) -> dict:
+    zb = zobrist_load()
+    results = {'depth': depth, 'time_budget': time_budget, 'runs': runs, 'machine': machine(), 'positions': {}}
+    for name, (position, expected) in POSITIONS.items():
+        results['positions'][name] = bench_position(position, expected, depth, time_budget, zb, runs)
+    positions = results['positions'].values()
+    results['total_nodes'] = sum(r['nodes'][-1] for r in positions)
+    results['total_time'] = round(sum(r['time'][-1] for r in positions), 4)
+    results['nps'] = round(results['total_nodes'] / max(results['total_time'], 1e-9))
+    results['solved'] = sum(1 for r in positions if r.get('solved'))
+    results['tactics'] = sum(1 for (_, expected) in POSITIONS.values() if expected)
+    return results
+
+def print_results(results: dict):
+    print(f"{'position':<28}{'nodes':>10}{'time':>9}{'nps':>9}{'ebf':>7}  move")
+    for name, r in results['positions'].items():
+        ebf = f"{r['ebf']:.2f}" if r['ebf'] else '-'
+        line = f"{name:<28}{r['nodes'][-1]:>10}{r['time'][-1]:>9.2f}{r['nps']:>9}{ebf:>7}  {r['move']}"
+        if 'solved' in r:
+            line += f"  {'solved' if r['solved'] else 'MISSED'} ({r['played']})"
+        print(line)
+    print(f"total {results['total_nodes']} nodes, {results['total_time']:.2f}s, {results['nps']} nps, solved {results['solved']}/{results['tactics']}")
+
+def compare(results: dict, baseline: dict, threshold: float=THRESHOLD, time_threshold: float=None) -> list:
+    # list of regressions against the baseline results, timing only with time_threshold and a baseline from this machine
+    regressions = []
+    if baseline.get('depth') != results['depth']:
+        return [f"baseline was run at depth {baseline.get('depth')}, not {results['depth']}"]
+    for name, r in results['positions'].items():
+        old = baseline['positions'].get(name)
+        if old is None:
+            continue
+        if r['nodes'][-1] > old['nodes'][-1] * (1 + threshold):
+            regressions.append(f"{name}: {r['nodes'][-1]} nodes, was {old['nodes'][-1]}")
+        if old.get('solved') and not r.get('solved'):
+            regressions.append(f"{name}: no longer solved, played {r.get('played')}")
+    if time_threshold is not None and baseline.get('machine') == results['machine']:
+        if results['nps'] < baseline['nps'] * (1 - time_threshold):
+            regressions.append(f"{results['nps']} nps, was {baseline['nps']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='search benchmark')
+    parser.add_argument('-d', '--depth', type=int, default=BENCH_DEPTH)
+    parser.add_argument('-t', '--time', type=float, default=BENCH_TIME, help='seconds to find the expected moves')
+    parser.add_argument('-o', '--out', help='write the results to this json file')
+    parser.add_argument('-b', '--baseline', nargs='?', const=BENCH_BASELINE, help='compare against this results file')
+    parser.add_argument('-n', '--runs', type=int, default=None, help=f'fixed depth runs a position, the fastest counts (default 1, {BENCH_RUNS} with --time-threshold)')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='allowed growth in nodes, 0.1 = 10%%')
+    parser.add_argument('--time-threshold', type=float, default=None, help='also fail when nps drops this much, 0.1 = 10%%')
+    args = parser.parse_args()
+    runs = args.runs or (BENCH_RUNS if args.time_threshold is not None else 1)
+
+    results = run(depth=args.depth, time_budget=args.time, runs=runs)
+    print_results(results)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if args.time_threshold is not None and baseline.get('machine') != results['machine']:
+            print(f"not checking time, {args.baseline} was written on {baseline.get('machine', 'another machine')}")
+        regressions = compare(results, baseline, args.threshold, args.time_threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+bitboard.py
+Bitboard tables and setwise move generation for the 8x5 board
+
+The 40 squares fit in one python int, square index is (r * 5) + c (same as the zobrist index)
+so bit 0 is the top left square and bit 39 is the bottom right square.
+
+Tables:
+1. knight and king attacks for every square
+2. rays in all 8 directions for every square (for bishops/rooks)
+3. pawn push/capture masks so all pawns of a color can be moved at once
+
+The generators here have to produce the same move sets as the per piece generators in moves.py
+"""
+
+from moves import TO_SHIFT, PROMO_SHIFT, CAPTURE, ENPASSANT, ENPASSANT_CAP
+from typing import List, Tuple
+
+ROWS, COLS = 8, 5
+NUM_SQUARES = ROWS * COLS
+FULL = (1 << NUM_SQUARES) - 1
+
+# bitboard index for each piece type, same as the zobrist_id of the piece
+BP, WP, WK, WN, WB, WR = 0, 1, 2, 3, 4, 5
+
+# rows and cols as masks
+ROW_MASKS = [sum(1 << (r * COLS + c) for c in range(COLS)) for r in range(ROWS)]
+COL_MASKS = [sum(1 << (r * COLS + c) for r in range(ROWS)) for c in range(COLS)]
+
+# square to (row, col), faster than divmod in the hot loop
+SQ_RC = [(sq // COLS, sq % COLS) for sq in range(NUM_SQUARES)]
+
+def _on_board(r, c):
+    return 0 <= r < ROWS and 0 <= c < COLS
+
+def _step_table(deltas):
+    # one mask per square of all the single step destinations
+    table = []
+    for sq in range(NUM_SQUARES):
+        r, c = SQ_RC[sq]
+        mask = 0
+        for (dr, dc) in deltas:
+            if _on_board(r + dr, c + dc):
+                mask |= 1 << ((r + dr) * COLS + c + dc)
+        table.append(mask)
+    return table
+
+KNIGHT_DELTAS = [(2, 1), (1, 2), (-2, 1), (-1, 2), (2, -1), (1, -2), (-2, -1), (-1, -2)]
+# white_king_moves skips every dr == dc, so the king can't step on the (1, 1)/(-1, -1) diagonal
+KING_DELTAS = [(dr, dc) for dr in range(-1, 2) for dc in range(-1, 2) if dr != dc]
+
+KNIGHT_ATTACKS = _step_table(KNIGHT_DELTAS)
+KING_ATTACKS = _step_table(KING_DELTAS)
+
+# rays, a direction is "positive" if walking it increases the square index
+# for positive rays the first blocker is the lowest bit, for negative rays the highest bit
+BISHOP_DIRS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+ROOK_DIRS = [(1, 0), (-1, 0), (0, -1), (0, 1)]
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(NUM_SQUARES):
+        r, c = SQ_RC[sq]
+        mask = 0
+        r, c = r + dr, c + dc
+        while _on_board(r, c):
+            mask |= 1 << (r * COLS + c)
+            r, c = r + dr, c + dc
+        table.append(mask)
+    return table
+
+# list of (ray table, positive) for each direction
+BISHOP_RAYS = [(_ray_table(dr, dc), dr * COLS + dc > 0) for (dr, dc) in BISHOP_DIRS]
+ROOK_RAYS = [(_ray_table(dr, dc), dr * COLS + dc > 0) for (dr, dc) in ROOK_DIRS]
+
+def slider_attacks(rays, sq: int, occ: int) -> int:
+    # every square a slider on sq can reach, including the first blocker in each direction
+    attacks = 0
+    for (table, positive) in rays:
+        ray = table[sq]
+        blockers = ray & occ
+        if blockers:
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= table[first] # cut the ray off behind the blocker
+        attacks |= ray
+    return attacks
+
+def bishop_attacks(sq: int, occ: int) -> int:
+    return slider_attacks(BISHOP_RAYS, sq, occ)
+
+def rook_attacks(sq: int, occ: int) -> int:
+    return slider_attacks(ROOK_RAYS, sq, occ)
+
+# pawn masks, white pawns move up (-5) and black pawns move down (+5)
+NOT_COL_0 = FULL ^ COL_MASKS[0]
+NOT_COL_4 = FULL ^ COL_MASKS[COLS - 1]
+# black_pawn_moves breaks out of its capture loop when c - 1 is off the board,
+# so a black pawn on col 0 has no captures at all (not even to the right)
+BP_CAP_LEFT_FROM = NOT_COL_0
+BP_CAP_RIGHT_FROM = NOT_COL_0 & NOT_COL_4
+
+# squares each pawn could capture on, no matter what is there (black col 0 quirk included)
+BP_ATTACKS = [(((1 << sq) & BP_CAP_LEFT_FROM) << (COLS - 1) | ((1 << sq) & BP_CAP_RIGHT_FROM) << (COLS + 1)) & FULL for sq in range(NUM_SQUARES)]
+WP_ATTACKS = [((1 << sq) & NOT_COL_0) >> (COLS + 1) | ((1 << sq) & NOT_COL_4) >> (COLS - 1) for sq in range(NUM_SQUARES)]
+# attacks for the pieces that don't slide, indexed by zobrist_id
+STEP_ATTACKS = [BP_ATTACKS, WP_ATTACKS, KING_ATTACKS, KNIGHT_ATTACKS]
+
+def piece_attacks(zobrist_id: int, sq: int, all_occ: int) -> int:
+    # every square a piece of this type on sq could capture on, sliders stop at the first blocker
+    if zobrist_id == WB:
+        return slider_attacks(BISHOP_RAYS, sq, all_occ)
+    if zobrist_id == WR:
+        return slider_attacks(ROOK_RAYS, sq, all_occ)
+    return STEP_ATTACKS[zobrist_id][sq]
+
+def iter_bits(b: int):
+    # yield the square index of every set bit, lowest first
+    while b:
+        low = b & -b
+        yield low.bit_length() - 1
+        b ^= low
+
+
+# Setwise move generation
+# bb: one bitboard per piece type (indexed by zobrist_id), occ: [black occupancy, white occupancy]
+# moves are written into the caps/quiets buffers (preallocated lists) and the counts are returned,
+# so the search can reuse one pair of buffers per ply
+# captures and quiet moves have their own generators so the search only makes the quiet moves if the captures don't cut off
+
+def white_captures(bb: List[int], occ: List[int], prev_mv: int, caps: List[int]) -> int:
+    nc = 0
+    black = occ[0]
+    all_occ = occ[0] | occ[1]
+
+    # king/knight, table lookups
+    for (table, pieces) in ((KING_ATTACKS, bb[WK]), (KNIGHT_ATTACKS, bb[WN])):
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            frm = low.bit_length() - 1
+            t = table[frm] & black
+            while t:
+                low = t & -t
+                t ^= low
+                caps[nc] = frm | ((low.bit_length() - 1) << TO_SHIFT) | CAPTURE
+                nc += 1
+
+    # bishops/rooks, rays cut at the first blocker
+    for (rays, pieces) in ((BISHOP_RAYS, bb[WB]), (ROOK_RAYS, bb[WR])):
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            frm = low.bit_length() - 1
+            t = slider_attacks(rays, frm, all_occ) & black
+            while t:
+                low = t & -t
+                t ^= low
+                caps[nc] = frm | ((low.bit_length() - 1) << TO_SHIFT) | CAPTURE
+                nc += 1
+
+    # pawns, up-left is -6 and up-right is -4
+    pawns = bb[WP]
+    for (shift, from_mask) in ((COLS + 1, NOT_COL_0), (COLS - 1, NOT_COL_4)):
+        t = ((pawns & from_mask) >> shift) & black
+        while t:
+            low = t & -t
+            t ^= low
+            to = low.bit_length() - 1
+            mv = (to + shift) | (to << TO_SHIFT) | CAPTURE
+            if to < COLS:
+                for promotion in range(1, 5):
+                    caps[nc] = mv | (promotion << PROMO_SHIFT)
+                    nc += 1
+            else:
+                caps[nc] = mv
+                nc += 1
+
+    return nc
+
+def white_quiets(bb: List[int], occ: List[int], quiets: List[int]) -> int:
+    nq = 0
+    all_occ = occ[0] | occ[1]
+    empty = FULL ^ all_occ
+
+    # king/knight, table lookups
+    for (table, pieces) in ((KING_ATTACKS, bb[WK]), (KNIGHT_ATTACKS, bb[WN])):
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            frm = low.bit_length() - 1
+            t = table[frm] & empty
+            while t:
+                low = t & -t
+                t ^= low
+                quiets[nq] = frm | ((low.bit_length() - 1) << TO_SHIFT)
+                nq += 1
+
+    # bishops/rooks, rays cut at the first blocker
+    for (rays, pieces) in ((BISHOP_RAYS, bb[WB]), (ROOK_RAYS, bb[WR])):
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            frm = low.bit_length() - 1
+            t = slider_attacks(rays, frm, all_occ) & empty
+            while t:
+                low = t & -t
+                t ^= low
+                quiets[nq] = frm | ((low.bit_length() - 1) << TO_SHIFT)
+                nq += 1
+
+    # pawns, all at once
+    pawns = bb[WP]
+    if pawns:
+        single = (pawns >> COLS) & empty
+        double = ((single & ROW_MASKS[5]) >> COLS) & empty
+        # pushes onto the top row promote, one move for each piece type
+        t = single & ROW_MASKS[0]
+        while t:
+            low = t & -t
+            t ^= low
+            to = low.bit_length() - 1
+            mv = (to + COLS) | (to << TO_SHIFT)
+            for promotion in range(1, 5):
+                quiets[nq] = mv | (promotion << PROMO_SHIFT)
+                nq += 1
+        t = single & ~ROW_MASKS[0]
+        while t:
+            low = t & -t
+            t ^= low
+            to = low.bit_length() - 1
+            quiets[nq] = (to + COLS) | (to << TO_SHIFT)
+            nq += 1
+        while double:
+            low = double & -double
+            double ^= low
+            to = low.bit_length() - 1
+            quiets[nq] = (to + 2 * COLS) | (to << TO_SHIFT) | ENPASSANT
+            nq += 1
+
+    return nq
+
+def white_moves(bb: List[int], occ: List[int], prev_mv: int, caps: List[int], quiets: List[int]) -> Tuple[int, int]:
+    return (white_captures(bb, occ, prev_mv, caps), white_quiets(bb, occ, quiets))
+
+def black_captures(bb: List[int], occ: List[int], prev_mv: int, caps: List[int]) -> int:
+    nc = 0
+    pawns = bb[BP]
+    white = occ[1]
+    empty = FULL ^ (occ[0] | occ[1])
+
+    # a push onto the back rank wins so it goes with the captures
+    t = (pawns << COLS) & empty & ROW_MASKS[ROWS - 1]
+    while t:
+        low = t & -t
+        t ^= low
+        to = low.bit_length() - 1
+        caps[nc] = (to - COLS) | (to << TO_SHIFT)
+        nc += 1
+
+    # down-left is +4 and down-right is +6
+    for (shift, from_mask) in ((COLS - 1, BP_CAP_LEFT_FROM), (COLS + 1, BP_CAP_RIGHT_FROM)):
+        t = ((pawns & from_mask) << shift) & white
+        while t:
+            low = t & -t
+            t ^= low
+            to = low.bit_length() - 1
+            caps[nc] = (to - shift) | (to << TO_SHIFT) | CAPTURE
+            nc += 1
+
+    # enpassant, only the pawn that just double pushed can be taken
+    if prev_mv and prev_mv & ENPASSANT:
+        ep_sq = (prev_mv >> TO_SHIFT) & 0x3F
+        ep_c = ep_sq % COLS
+        for (dc, from_mask) in ((1, BP_CAP_LEFT_FROM), (-1, BP_CAP_RIGHT_FROM)):
+            # the capturing pawn sits beside the double pushed pawn on the same row
+            if ep_c + dc < 0 or ep_c + dc >= COLS:
+                continue
+            frm = ep_sq + dc
+            if pawns & from_mask & (1 << frm):
+                caps[nc] = frm | ((ep_sq + COLS) << TO_SHIFT) | CAPTURE | ENPASSANT_CAP
+                nc += 1
+
+    return nc
+
+def black_quiets(bb: List[int], occ: List[int], quiets: List[int]) -> int:
+    nq = 0
+    empty = FULL ^ (occ[0] | occ[1])
+    t = (bb[BP] << COLS) & empty & ~ROW_MASKS[ROWS - 1]
+    while t:
+        low = t & -t
+        t ^= low
+        to = low.bit_length() - 1
+        quiets[nq] = (to - COLS) | (to << TO_SHIFT)
+        nq += 1
+    return nq
+
+def black_moves(bb: List[int], occ: List[int], prev_mv: int, caps: List[int], quiets: List[int]) -> Tuple[int, int]:
+    return (black_captures(bb, occ, prev_mv, caps), black_quiets(bb, occ, quiets))
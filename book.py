@@ -0,0 +1,199 @@
+"""
+book.py
+Opening book, the first plies of every starting setup searched deep ahead of time
+
+Usage: python3 book.py [-p PLIES] [-d DEPTH] [-t SECONDS] [-w WORKERS] [-o book.bin]
+       python3 book.py -s [back rank]
+-p: how many plies from the start the book covers (default 3)
+-d/-t: depth (and optional seconds) of the search for every book position
+-w: worker processes, one per core by default
+-s: show the book moves of one setup (or every setup)
+
+fill_board shuffles 'knrb ' so a game starts from one of 5! = 120 back ranks. For each of them the book has two trees:
+1. the engine plays white: its positions get searched and only the book move is followed,
+   after that every black reply is followed to the engine's next position
+2. the engine plays black: every white move is followed, then the same as above
+so whatever the opponent plays in the first PLIES plies, the engine has a book move.
+
+The file is a header (BOOK_HEADER_SIZE bytes): magic, version, # of entries, zobrist checksum, depth, plies
+then the keys sorted (little endian np.uint64) and the entries (packed like the tt, zobrist_hashing.tt_pack).
+It is opened with np.memmap and looked up with a binary search, so loading it costs nothing.
+Keys are the zobrist hash (calculate_zb_hash), the file only works with the zb.npy it was built with.
+"""
+
+import os
+import time
+import struct
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import board as B
+import ordering
+from moves import move_str
+from zobrist_hashing import TranspositionTable, TT_Entry, tt_pack, tt_unpack, zobrist_checksum, zobrist_load
+
+BOOK_FILE = 'book.bin'
+BOOK_MAGIC = b'NEGAMXBK'
+BOOK_HEADER = '<8sIQQII' # magic, version, # of entries, zobrist checksum, depth, plies
+BOOK_HEADER_SIZE = 64
+BOOK_VERSION = 1
+BOOK_PLIES = 3
+BOOK_DEPTH = 9
+BOOK_TT_MB = 16 # every book search starts with an empty table of this size
+
+class Book:
+    # sorted keys and their packed entries, both usually memory mapped
+    def __init__(self, keys, data, depth:int=0, plies:int=0):
+        self.keys = keys
+        self.data = data
+        self.depth = depth
+        self.plies = plies
+
+    def __len__(self):
+        return len(self.keys)
+
+def book_probe(book:Book, key:int) -> TT_Entry:
+    # the book entry for the position or None
+    key = np.uint64(int(key))
+    i = int(np.searchsorted(book.keys, key))
+    if i < len(book.keys) and book.keys[i] == key:
+        return tt_unpack(int(book.data[i]))
+    return None
+
+def book_write(fname:str, entries:dict, zb:np.typing.ArrayLike, depth:int, plies:int):
+    # entries: key -> (move, score, depth)
+    keys = np.array(sorted(entries), dtype='<u8')
+    data = np.array([tt_pack(score, d, 0, mv, 0) for (mv, score, d) in (entries[int(key)] for key in keys)], dtype='<u8')
+    header = struct.pack(BOOK_HEADER, BOOK_MAGIC, BOOK_VERSION, len(keys), zobrist_checksum(zb), depth, plies)
+    with open(fname, 'wb') as f:
+        f.write(header.ljust(BOOK_HEADER_SIZE, b'\0'))
+        f.write(keys.tobytes())
+        f.write(data.tobytes())
+
+def book_load(fname=BOOK_FILE, zb:np.typing.ArrayLike=None) -> Book:
+    with open(fname, 'rb') as f:
+        magic, version, n, checksum, depth, plies = struct.unpack(BOOK_HEADER, f.read(struct.calcsize(BOOK_HEADER)))
+    if magic != BOOK_MAGIC or version != BOOK_VERSION:
+        raise ValueError(f'{fname} is not a book file for this version')
+    if zb is not None and checksum != zobrist_checksum(zb):
+        raise ValueError(f'{fname} was built with different zobrist keys')
+    if n == 0:
+        return Book(keys=np.zeros(0, dtype='<u8'), data=np.zeros(0, dtype='<u8'), depth=depth, plies=plies)
+    keys = np.memmap(fname, dtype='<u8', mode='r', offset=BOOK_HEADER_SIZE, shape=(n,))
+    data = np.memmap(fname, dtype='<u8', mode='r', offset=BOOK_HEADER_SIZE + 8 * n, shape=(n,))
+    return Book(keys=keys, data=data, depth=depth, plies=plies)
+
+def back_ranks():
+    # every arrangement fill_board can shuffle 'knrb ' into
+    return [''.join(p) for p in itertools.permutations('knrb ')]
+
+
+# Building
+
+_zb = None
+
+def _init_worker(zb):
+    global _zb
+    _zb = zb
+
+def _search_position(position:str, prev_move:int, depth:int, time_limit:float):
+    # runs in a worker, returns (key, move, score, depth), from a clean state so the book doesn't depend
+    # on which worker searched what
+    import search as S # the search probes the book, so not at the top
+    turn = B.load_board_str(position, prev_move)
+    ordering.clear()
+    key = int(B.calculate_zb_hash(_zb, turn))
+    mv = S.iterative_deepening(prev_move=prev_move, turn=turn, max_depth=depth, time_limit=time_limit, zb=_zb, board_zb_hash=key, tt=TranspositionTable(size_mb=BOOK_TT_MB))
+    return (key, mv, S.completed_score, S.completed_depth)
+
+def _children(position:str, prev_move:int, mvs):
+    # position strings after each of mvs, skipping finished games
+    turn = B.load_board_str(position, prev_move)
+    children = []
+    for mv in mvs:
+        B.make_board_move(mv=mv)
+        if not B.check_win():
+            children.append((B.board_to_str(not turn), mv))
+        B.undo_board_move(mv=mv)
+    return children
+
+def build(zb, plies:int=BOOK_PLIES, depth:int=BOOK_DEPTH, time_limit:float=None, workers:int=None, log=print) -> dict:
+    # key -> (move, score, depth) for every position the engine can meet in the first plies, searched in parallel
+    # a ply of the trees is searched before the next one is made, the book moves decide where the trees go
+    entries = {}
+    seen = set() # (key, engine to move) already in a tree
+    # (position, prev_move, engine to move), the white trees and the black trees
+    frontier = []
+    for back_rank in back_ranks():
+        B.fill_board(white_back_rank=back_rank)
+        position = B.board_to_str(True)
+        frontier += [(position, None, True), (position, None, False)]
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker, initargs=(zb,)) as pool:
+        for ply in range(plies):
+            # drop transpositions (several setups share positions once pieces have moved)
+            nodes = []
+            for (position, prev_move, ours) in frontier:
+                turn = B.load_board_str(position, prev_move)
+                key = int(B.calculate_zb_hash(zb, turn))
+                if (key, ours) not in seen:
+                    seen.add((key, ours))
+                    nodes.append((position, prev_move, ours, key))
+
+            # the engine's positions get searched
+            start = time.perf_counter()
+            todo = [(position, prev_move, key) for (position, prev_move, ours, key) in nodes if ours and key not in entries]
+            futures = [pool.submit(_search_position, position, prev_move, depth, time_limit) for (position, prev_move, _) in todo]
+            for future in futures:
+                key, mv, score, d = future.result()
+                if mv is not None:
+                    entries[key] = (mv, score, d)
+            log(f'ply {ply}: {len(nodes)} positions, {len(todo)} searched in {time.perf_counter() - start:.1f}s, {len(entries)} entries')
+
+            # next ply: the book move from the engine's positions, every move from the opponent's
+            if ply + 1 == plies:
+                break
+            frontier = []
+            for (position, prev_move, ours, key) in nodes:
+                turn = B.load_board_str(position, prev_move)
+                if ours:
+                    if key not in entries:
+                        continue
+                    mvs = [entries[key][0]]
+                else:
+                    caps, quiets = B.get_player_moves(turn, prev_move)
+                    mvs = caps + quiets
+                frontier += [(child, mv, not ours) for (child, mv) in _children(position, prev_move, mvs)]
+    return entries
+
+def show(book:Book, zb, back_rank:str=None):
+    for rank in ([back_rank] if back_rank is not None else back_ranks()):
+        B.fill_board(white_back_rank=rank)
+        entry = book_probe(book, B.calculate_zb_hash(zb, True))
+        if entry is None:
+            print(f'"{rank}": not in the book')
+        else:
+            print(f'"{rank}": {move_str(entry.best_move)}, score {entry.value}, depth {entry.depth}')
+
+def main():
+    parser = argparse.ArgumentParser(description='build the opening book')
+    parser.add_argument('-p', '--plies', type=int, default=BOOK_PLIES)
+    parser.add_argument('-d', '--depth', type=int, default=BOOK_DEPTH)
+    parser.add_argument('-t', '--time', type=float, default=None, help='seconds per position')
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('-o', '--out', default=BOOK_FILE)
+    parser.add_argument('-s', '--show', nargs='?', const='', default=None, help='show the book moves of a back rank')
+    args = parser.parse_args()
+
+    zb = zobrist_load()
+    if args.show is not None:
+        show(book_load(args.out, zb=zb), zb, args.show or None)
+        return
+    start = time.perf_counter()
+    entries = build(zb, plies=args.plies, depth=args.depth, time_limit=args.time, workers=args.workers)
+    book_write(args.out, entries, zb, args.depth, args.plies)
+    print(f'{len(entries)} entries written to {args.out} in {time.perf_counter() - start:.0f}s')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+engine.py
+Headless engine, drives the search with a line based text protocol on stdin/stdout (no pygame, starts right away)
+
+Usage: python3 engine.py
+
+Commands, one per line (answers are one line each, unknown commands get "error ..."):
+hello                               -> id name ..., the options as "option NAME VALUE" lines, then ok
+isready                             -> readyok (answered at once, even while searching)
+setoption NAME VALUE                hash (table MB, 0 = no table), time (seconds a go, 0 = none), depth, nodes (0 = none)
+                                    book (file or none), tablebases (directory or none)
+position start [BACK RANK] [moves M1 M2 ...]
+                                    fill_board's setup, back rank like "knrb_" ('_' for the empty square), random if left out
+position board ROWS w|b [moves M1 M2 ...]
+                                    a board.board_to_str position
+moves                               -> moves M1 M2 ..., the legal moves of the side to move
+board                               -> board ROWS w|b
+go [depth N] [time SECONDS] [nodes N] [infinite]
+                                    search in the background (the options are the defaults), every finished depth is an
+                                    "info depth D score S nodes N nps N time MS pv M1 M2 ..." line and the end is
+                                    "bestmove M" (bestmove none if the game is over or there are no moves)
+stop                                end the search now, its bestmove still comes
+quit
+
+Moves are moves.move_text ("c8c3": column letter and row, rows 1-8 as move_str numbers them, then a promotion letter).
+Scores are for the side to move, +-1000 is a won/lost game. The pv is the best move then the table's best moves.
+"""
+
+import sys
+import time
+import threading
+from types import SimpleNamespace
+import board as B
+import search as S
+from moves import move_text, parse_move
+from zobrist_hashing import TranspositionTable, tt_lookup, zobrist_load, TT_SIZE_MB
+
+ENGINE_NAME = 'zerg-chess negamax'
+ENGINE_TIME = 5.0 # seconds a go by default
+
+options = {'hash': TT_SIZE_MB, 'time': ENGINE_TIME, 'depth': S.MAX_PLY - 1, 'nodes': 0, 'book': 'none', 'tablebases': 'none'}
+
+zb = None
+tt = None
+turn = True
+prev_move = None
+board_zb_hash = None
+searching = None # thread of the running go
+stop = SimpleNamespace(value=0) # search.stop, set by the stop command
+_out = threading.Lock()
+
+def send(line: str):
+    # the search thread talks too, one line at a time
+    with _out:
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+def _pv(mv: int, depth: int) -> list:
+    # mv, then the best moves the table has for the positions after it, the board is put back before returning
+    pv = []
+    side, prev, h = turn, prev_move, board_zb_hash
+    try:
+        while mv and len(pv) < depth:
+            h = B.make_board_move(mv=mv, zb=zb, board_zb_hash=h)
+            pv.append(mv)
+            side, prev = not side, mv
+            if tt is None or B.check_win():
+                break
+            entry = tt_lookup(tt, int(h))
+            mv = entry.best_move if entry and B.is_pseudo_legal(side, prev, entry.best_move) else 0
+    finally:
+        for mv in reversed(pv):
+            B.undo_board_move(mv=mv)
+    return pv
+
+def _reporter(event: dict):
+    # search.reporter, runs in the search thread between iterations (the board is at the root)
+    st = S.stats
+    source = ' book' if event.get('book') else ' tablebase' if event.get('tb') else ''
+    if event['event'] == 'iteration' or source:
+        pv = ' '.join(move_text(mv) for mv in _pv(event['move'], event['depth']))
+        elapsed = time.perf_counter() - st.start
+        send(f"info depth {event['depth']} score {event['score']} nodes {st.nodes} nps {int(st.nps())} time {int(elapsed * 1000)}{source} pv {pv}")
+
+def _search(max_depth: int, time_limit: float, node_limit: int):
+    S.stop = stop
+    try:
+        mv = S.iterative_deepening(prev_move=prev_move, turn=turn, max_depth=max_depth, time_limit=time_limit, node_limit=node_limit, zb=zb, board_zb_hash=board_zb_hash, tt=tt)
+    finally:
+        S.stop = None
+    send(f"bestmove {move_text(mv) if mv else 'none'}")
+
+def wait_search():
+    # stop the running go (it still sends its bestmove) and wait for it, the board is ours again after
+    global searching
+    if searching is not None:
+        stop.value = 1
+        searching.join()
+        searching = None
+
+def set_position(words: list):
+    # built on a new Position that replaces the old one only once all of it parsed, an error leaves the game as it was
+    global turn, prev_move, board_zb_hash
+    if 'moves' in words:
+        i = words.index('moves')
+        words, mvs = words[:i], words[i + 1:]
+    else:
+        mvs = []
+    pos = B.Position()
+    if words[:1] == ['start'] and len(words) <= 2:
+        pos.fill(white_back_rank=words[1].replace('_', ' ') if len(words) == 2 else None)
+        side = True
+    elif words[:1] == ['board'] and len(words) == 3:
+        side = pos.load_str(f'{words[1]} {words[2]}')
+    else:
+        raise ValueError('expected position start [BACK RANK] or position board ROWS w|b, then [moves ...]')
+    prev = None
+    h = pos.calculate_zb_hash(zb, side)
+    for text in mvs:
+        caps, quiets = pos.get_player_moves(side, prev)
+        mv = parse_move(text, caps + quiets)
+        if mv is None or pos.check_win():
+            raise ValueError(f'{text} is not a legal move in {pos.to_str(side)}')
+        h = pos.make_move(mv=mv, zb=zb, board_zb_hash=h)
+        side, prev = not side, mv
+    S.use_position(pos)
+    turn, prev_move, board_zb_hash = side, prev, h
+
+def set_option(name: str, value: str):
+    global tt
+    if name not in options:
+        raise ValueError(f'unknown option {name}')
+    if name in ('book', 'tablebases'):
+        # loaded when asked for, the engine starts without them
+        if name == 'book':
+            from book import book_load
+            S.book = None if value == 'none' else book_load(value, zb=zb)
+        else:
+            from tablebase import tb_load, tb_pieces
+            S.tablebases = None if value == 'none' else tb_load(value) or None
+            S.tb_max = tb_pieces(S.tablebases or {})
+        options[name] = value
+        return
+    options[name] = float(value) if name == 'time' else int(value)
+    if name == 'hash':
+        tt = None # made again by the next go
+
+def go(words: list):
+    global searching, tt
+    limits = {'depth': options['depth'], 'time': options['time'], 'nodes': options['nodes']}
+    i = 0
+    while i < len(words):
+        if words[i] == 'infinite':
+            limits.update(depth=S.MAX_PLY - 1, time=0, nodes=0)
+            i += 1
+        elif words[i] in limits and i + 1 < len(words):
+            limits[words[i]] = float(words[i + 1]) if words[i] == 'time' else int(words[i + 1])
+            i += 2
+        else:
+            raise ValueError(f'go: unexpected {words[i]}')
+    if tt is None and options['hash']:
+        tt = TranspositionTable(size_mb=options['hash'])
+    stop.value = 0
+    searching = threading.Thread(target=_search, args=(limits['depth'], limits['time'] or None, limits['nodes'] or None), daemon=True)
+    searching.start()
+
+def handle(line: str) -> bool:
+    # one command, False after quit
+    words = line.split()
+    if not words:
+        return True
+    cmd, args = words[0], words[1:]
+    if cmd == 'quit':
+        wait_search()
+        return False
+    if cmd == 'isready':
+        send('readyok')
+    elif cmd == 'stop':
+        wait_search()
+    elif cmd == 'hello':
+        send(f'id name {ENGINE_NAME}')
+        for (name, value) in options.items():
+            send(f'option {name} {value}')
+        send('ok')
+    else:
+        # everything else needs the board, a running search gets stopped first
+        wait_search()
+        if cmd == 'position':
+            set_position(args)
+        elif cmd == 'setoption' and len(args) == 2:
+            set_option(args[0], args[1])
+        elif cmd == 'go':
+            go(args)
+        elif cmd == 'moves':
+            caps, quiets = B.get_player_moves(turn, prev_move)
+            send(' '.join(['moves'] + [move_text(mv) for mv in caps + quiets]))
+        elif cmd == 'board':
+            send(f'board {B.board_to_str(turn)}')
+        else:
+            raise ValueError(f'unknown command {line.strip()}')
+    return True
+
+def main():
+    global zb, board_zb_hash
+    zb = zobrist_load()
+    S.reporter = _reporter
+    B.fill_board(white_back_rank='knrb ')
+    board_zb_hash = B.calculate_zb_hash(zb, turn)
+    for line in sys.stdin:
+        try:
+            if not handle(line):
+                break
+        except (ValueError, OSError) as e:
+            send(f'error {e}')
+    wait_search()
+
+if __name__ == "__main__":
+    main()
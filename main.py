@@ -1,12 +1,16 @@
 import pygame
 from sys import argv
+from os.path import isfile
 import sys
-import numpy as np
 from piece import Piece
-from moves import Move
-from board import fill_board, make_board_move, undo_board_move, calculate_zb_hash, update_board_zb_hash, board, BOARD_SIZE, COLS, ROWS
-from search import nega_max_root
-from zobrist_hashing import tt_load, zobrist_load
+from moves import move_end
+from board import fill_board, make_board_move, undo_board_move, calculate_zb_hash, check_win, board, position, BOARD_SIZE, COLS, ROWS
+import search
+from worker import SearchWorker
+from stats import print_reporter
+from book import book_load, BOOK_FILE
+from tablebase import tb_load, tb_pieces, TB_DIR
+from zobrist_hashing import tt_load, tt_make_file, tt_flush, zobrist_load, TT_FILE
 
 pygame.init()
 
@@ -117,7 +121,7 @@ def is_opponent(piece1: Piece, piece2: Piece):
 def find_mv(r, c, mvs):
     # iterate through moves
     for mv in mvs:
-        if r == mv.re and c == mv.ce:
+        if (r, c) == move_end(mv):
             return mv
     return None
 
@@ -132,7 +136,9 @@ def main():
     turn = True  # White starts
     ai_white = False
     ai_black = False
-    depth = 7
+    depth = 7 # max depth, iterative deepening stops earlier if the time runs out
+    time_limit = 5.0 # seconds per AI move
+    search.reporter = print_reporter # scores and node counts of every iteration to the console
 
     # transposition table stuff here: update these manually cuz lazy
     use_tt = True
@@ -141,13 +147,43 @@ def main():
     tt = None
     board_zb_hash = None
     if use_tt:
-        tt = tt_load()
         zb = zobrist_load()
+        if not isfile(TT_FILE):
+            tt_make_file(zb=zb)
+        try:
+            # mapped, so this is instant, if we don't update the file it is opened read only
+            tt = tt_load(zb=zb, readonly=not update_tt)
+        except ValueError:
+            # file is from different zobrist keys, start over
+            tt_make_file(zb=zb)
+            tt = tt_load(zb=zb, readonly=not update_tt)
         board_zb_hash = calculate_zb_hash(zb=zb)
         print(board_zb_hash)
+        # opening book, build it with book.py
+        if isfile(BOOK_FILE):
+            try:
+                search.book = book_load(zb=zb)
+            except ValueError:
+                print(f'{BOOK_FILE} was built for other zobrist keys, not using it')
+    # endgame tablebases, generate them with tablebase.py
+    try:
+        search.tablebases = tb_load(TB_DIR) or None
+        search.tb_max = tb_pieces(search.tablebases or {})
+    except ValueError as e:
+        print(f'{e}, not using the tablebases')
 
     history = []  # no moves to undo
 
+    # the AI searches in a background thread (worker.py) so the window keeps drawing and the buttons keep working
+    # while it is the human's turn the worker ponders the reply it expects, which fills the table for the next search
+    worker = SearchWorker(zb=zb, tt=tt, flush=tt is not None and update_tt) # the worker saves the table after each search
+    ponder = True
+    ai_job = None # id of the search for the AI move, None when the AI isn't thinking
+
+    def start_ai():
+        prev_move = history[-1] if history else None
+        return worker.search(position, prev_move=prev_move, turn=turn, board_zb_hash=board_zb_hash, max_depth=depth, time_limit=time_limit)
+
     run = True
     while run:
         draw_board(WIN)
@@ -158,35 +194,50 @@ def main():
         for mv in legal_moves:
             s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
             s.fill(HIGHLIGHT)
-            WIN.blit(s, (mv.ce*SQUARE_SIZE, mv.re*SQUARE_SIZE))
+            re, ce = move_end(mv)
+            WIN.blit(s, (ce*SQUARE_SIZE, re*SQUARE_SIZE))
 
         pygame.display.flip()
         clock.tick(60)
 
+        # the AI move, once the worker has one
+        for result in worker.poll():
+            if result.job != ai_job:
+                continue # cancelled by an undo
+            ai_job = None
+            if result.move:
+                board_zb_hash = make_board_move(mv=result.move, zb=zb, board_zb_hash=board_zb_hash)
+                history.append(result.move)
+                turn = not turn
+                # the human's turn, think about their reply in the meantime
+                if ponder and not check_win() and not (ai_white if turn else ai_black):
+                    worker.ponder(position, prev_move=result.move, turn=turn, board_zb_hash=board_zb_hash)
+            # reset selection
+            selected, legal_moves = None, []
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 run = False
+                worker.close()
+                if tt is not None and update_tt:
+                    tt_flush(tt)
                 pygame.quit()
                 sys.exit()
 
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if undo_button.collidepoint(event.pos):
                     if history:
+                        # whatever the worker is doing is about a position that is gone
+                        worker.cancel()
+                        ai_job = None
                         board_zb_hash = undo_board_move(mv=history.pop(), zb=zb, board_zb_hash=board_zb_hash)
                         turn = not turn  # reverse turn
+                        selected, legal_moves = None, []
                     continue
 
                 if ai_button.collidepoint(event.pos):
-                    # TODO, execute ai move
-                    prev_move = None
-                    if history:
-                        prev_move = history[-1]
-                    # make depth odd so the first player doesn't do something dumb
-                    ai_mv = nega_max_root(prev_move=prev_move, d=depth, alpha=-1000, beta=1000, turn=turn)
-                    if ai_mv:
-                        make_board_move(mv=ai_mv)
-                        history.append(ai_mv)
-                        turn = not turn
+                    if ai_job is None:
+                        ai_job = start_ai()
                     # reset selection
                     selected, legal_moves = None, []
                     continue
@@ -200,13 +251,14 @@ def main():
                     continue
 
                 row, col = get_square_under_mouse()
-                if row is None:  # clicked panel
+                if row is None or ai_job is not None:  # clicked panel or the AI is thinking
                     continue
                 piece = board[row][col]
 
                 if selected:
                     mv = find_mv(r=row, c=col, mvs=legal_moves)
                     if mv:
+                        worker.cancel() # stop pondering
                         board_zb_hash = make_board_move(mv=mv, zb=zb, board_zb_hash=board_zb_hash)
                         history.append(mv)  # save move
                         turn = not turn
@@ -217,33 +269,10 @@ def main():
                         legal_moves = piece.get_moves(board, history[-1] if len(history) != 0 else None)
                         legal_moves = legal_moves[0] + legal_moves[1]
         # if no event check if ai turn is to play
-        if ai_white and turn:
-            prev_move = None
-            if history:
-                prev_move = history[-1]
-            # make depth odd so the first player doesn't do something dumb
-            ai_mv = nega_max_root(prev_move=prev_move, d=depth, alpha=-1000, beta=1000, turn=turn)
-            if ai_mv:
-                make_board_move(mv=ai_mv)
-                history.append(ai_mv)
-                turn = not turn
-            # reset selection
-            selected, legal_moves = None, []
-            continue
-
-        if ai_black and not turn:
-            prev_move = None
-            if history:
-                prev_move = history[-1]
-            # make depth odd so the first player doesn't do something dumb
-            ai_mv = nega_max_root(prev_move=prev_move, d=depth, alpha=-1000, beta=1000, turn=turn)
-            if ai_mv:
-                make_board_move(mv=ai_mv)
-                history.append(ai_mv)
-                turn = not turn
+        if ai_job is None and (ai_white if turn else ai_black) and not check_win():
+            ai_job = start_ai()
             # reset selection
             selected, legal_moves = None, []
-            continue
 
 if __name__ == "__main__":
     main()
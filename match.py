@@ -0,0 +1,253 @@
+"""
+match.py
+Self-play match between two engine configurations, headless and in parallel, stopped early by an SPRT
+
+Usage: python3 match.py [-a "depth=5"] [-b "depth=5 tt=0"] [-g GAMES] [-j WORKERS] [-o match.jsonl]
+                        [--elo0 0] [--elo1 10] [--alpha 0.05] [--beta 0.05] [-r PLIES]
+-a/-b: the two engines, "key=value" separated by spaces:
+       depth, time (seconds a move), nodes (a move), tt (table MB, 0 = no table)
+       and module globals of the search, "search.QS_MAX_DEPTH=4", "search.BATCH_EVAL=True", "search.QS_NODE_LIMIT=128"
+       (not the ones in FIXED_GLOBALS, they size buffers made when the modules are imported)
+-g: most games to play (pairs of two), -j: worker processes (one per core by default)
+-o: every game as one json line, written as soon as it is done, moves as moves.move_text ("c7c6")
+-r: random plies played after the setup, so depth limited games (which always play the same) don't repeat
+
+Games go in pairs: pair i starts from the back rank i % 120 (book.back_ranks, every setup fill_board can make) plus
+the same random plies, A plays white in one game and black in the other. White and black play different armies so
+a single game says little, the pair is what gets scored (0, 0.25, ... 1 for A) and a worker plays both games.
+Each engine gets its own empty table every game and empty ordering tables (killers, history) every move, so the
+engines don't help each other and a game doesn't depend on which worker played it.
+
+SPRT: H0 is A is elo0 stronger than B, H1 is elo1. The log likelihood ratio uses the normal approximation of the pair
+scores (as fishtest's GSPRT does), the match stops when it leaves [log(beta / (1 - alpha)), log((1 - beta) / alpha)]
+(H0 accepted below, H1 above) or the games run out. The variance of a handful of pairs is no estimate at all, so
+nothing is decided before SPRT_MIN_PAIRS pairs.
+"""
+
+import os
+import ast
+import json
+import math
+import time
+import random
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import board as B
+import search as S
+import ordering
+from book import back_ranks
+from moves import move_text
+from zobrist_hashing import TranspositionTable, zobrist_load
+
+MATCH_GAMES = 2000
+MATCH_PLIES = 400 # a game this long is a draw, black runs out of pawn moves long before
+RANDOM_PLIES = 2
+SPRT_MIN_PAIRS = 20
+ENGINE_DEFAULTS = {'depth': 5, 'time': None, 'nodes': None, 'tt': 16}
+OVERRIDE_MODULES = ('search', 'ordering', 'batch_eval', 'board', 'position')
+# the killer and per-ply buffers are made with these at import, changing them later breaks the search
+FIXED_GLOBALS = ('search.MAX_PLY', 'ordering.MAX_PLY', 'ordering.NUM_KILLERS')
+
+def parse_engine(text: str) -> dict:
+    # "depth=5 tt=0 search.QS_MAX_DEPTH=4" -> {'depth': 5, 'time': None, 'nodes': None, 'tt': 0, 'search.QS_MAX_DEPTH': 4}
+    engine = dict(ENGINE_DEFAULTS)
+    for item in text.split():
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f'{item}: expected key=value')
+        if '.' in key:
+            module, _, name = key.partition('.')
+            if module not in OVERRIDE_MODULES or not hasattr(importlib.import_module(module), name):
+                raise ValueError(f'{key}: not a global of {", ".join(OVERRIDE_MODULES)}')
+            if key in FIXED_GLOBALS:
+                raise ValueError(f'{key}: fixed when the search is imported, it can\'t differ between engines')
+        elif key not in ENGINE_DEFAULTS:
+            raise ValueError(f'{key}: expected one of {", ".join(ENGINE_DEFAULTS)} or module.NAME')
+        try:
+            engine[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            engine[key] = value
+    return engine
+
+def elo_score(elo: float) -> float:
+    # expected score of the stronger side
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def score_elo(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def sprt_llr(scores, elo0: float, elo1: float) -> float:
+    # log likelihood ratio of H1 against H0 from the pair scores, 0 until they vary
+    n = len(scores)
+    if n < 2:
+        return 0.0
+    mean = sum(scores) / n
+    var = sum((x - mean) ** 2 for x in scores) / n
+    if var == 0:
+        return 0.0
+    s0, s1 = elo_score(elo0), elo_score(elo1)
+    return n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * var)
+
+def sprt_bounds(alpha: float, beta: float):
+    return (math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha))
+
+
+# Playing, in the workers
+
+_zb = None
+_defaults = {} # module.NAME -> value before any engine changed it
+
+def _init_worker(zb):
+    global _zb
+    _zb = zb
+
+def _configure(engine: dict, keys):
+    # set the module globals of engine, the ones only the other engine changes go back to their defaults
+    for key in keys:
+        module, _, name = key.partition('.')
+        module = importlib.import_module(module)
+        if key not in _defaults:
+            _defaults[key] = getattr(module, name)
+        setattr(module, name, engine.get(key, _defaults[key]))
+
+def _opening(pair: int, plies: int) -> tuple:
+    # (back rank, random moves) of a pair, the same for both of its games
+    back_rank = back_ranks()[pair % 120]
+    rng = random.Random(pair)
+    B.fill_board(white_back_rank=back_rank)
+    turn, prev_move, mvs = True, None, []
+    for _ in range(plies):
+        caps, quiets = B.get_player_moves(turn, prev_move)
+        if not caps + quiets:
+            break
+        mv = rng.choice(caps + quiets)
+        B.make_board_move(mv=mv)
+        if B.check_win(): # don't start from a finished game, stop a ply earlier
+            B.undo_board_move(mv=mv)
+            break
+        mvs.append(mv)
+        turn, prev_move = not turn, mv
+    return (back_rank, mvs)
+
+def play_game(white: dict, black: dict, back_rank: str, opening) -> dict:
+    # one game, returns the result for white (1, 0.5, 0) and what each side spent
+    keys = {key for engine in (white, black) for key in engine if '.' in key}
+    B.fill_board(white_back_rank=back_rank)
+    turn, prev_move = True, None
+    board_zb_hash = B.calculate_zb_hash(_zb, turn)
+    for mv in opening:
+        board_zb_hash = B.make_board_move(mv=mv, zb=_zb, board_zb_hash=board_zb_hash)
+        turn, prev_move = not turn, mv
+    tables = {side: TranspositionTable(size_mb=engine['tt']) if engine['tt'] else None for (side, engine) in ((True, white), (False, black))}
+    spent = {True: [0, 0.0], False: [0, 0.0]} # nodes, seconds
+    moves = []
+    result, end = 0.5, 'max plies'
+    while len(opening) + len(moves) < MATCH_PLIES:
+        win = B.check_win()
+        if win:
+            result, end = (1 if win > 0 else 0), 'win'
+            break
+        engine = white if turn else black
+        _configure(engine, keys)
+        ordering.clear()
+        start = time.perf_counter()
+        mv = S.iterative_deepening(prev_move=prev_move, turn=turn, max_depth=engine['depth'], time_limit=engine['time'], node_limit=engine['nodes'], zb=_zb, board_zb_hash=board_zb_hash, tt=tables[turn])
+        spent[turn][0] += S.stats.nodes
+        spent[turn][1] += time.perf_counter() - start
+        if mv is None: # no moves
+            result, end = 0.5, 'stalemate'
+            break
+        board_zb_hash = B.make_board_move(mv=mv, zb=_zb, board_zb_hash=board_zb_hash)
+        moves.append(mv)
+        turn, prev_move = not turn, mv
+    return {'result': result, 'end': end, 'plies': len(opening) + len(moves), 'moves': [move_text(mv) for mv in opening + moves],
+            'white': {'nodes': spent[True][0], 'time': round(spent[True][1], 3)},
+            'black': {'nodes': spent[False][0], 'time': round(spent[False][1], 3)}}
+
+def play_pair(pair: int, a: dict, b: dict, plies: int) -> list:
+    # A as white, then A as black, from the same opening
+    back_rank, opening = _opening(pair, plies)
+    games = []
+    for a_white in (True, False):
+        game = play_game(a if a_white else b, b if a_white else a, back_rank, opening)
+        game['score_a'] = game['result'] if a_white else 1 - game['result']
+        games.append({'pair': pair, 'opening': back_rank, 'a_white': a_white, **game})
+    return games
+
+
+def run_match(a: dict, b: dict, games: int=MATCH_GAMES, workers: int=None, out=None, elo0: float=0, elo1: float=10,
+              alpha: float=0.05, beta: float=0.05, plies: int=RANDOM_PLIES, log=print) -> dict:
+    # plays pairs until the SPRT decides or games run out, out gets one json line per game
+    lower, upper = sprt_bounds(alpha, beta)
+    pairs = games // 2
+    workers = workers or os.cpu_count()
+    scores = [] # per pair, for A
+    totals = {'w': 0, 'd': 0, 'l': 0} # games, from A's side
+    llr, decision = 0.0, None
+    start = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(zobrist_load(),))
+    try:
+        running = set()
+        submitted = 0
+        while decision is None and (submitted < pairs or running):
+            # keep every worker busy, a few more in line so none waits on us
+            while submitted < pairs and len(running) < 2 * workers:
+                running.add(pool.submit(play_pair, submitted, a, b, plies))
+                submitted += 1
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                pair_games = future.result()
+                for game in pair_games:
+                    totals['w' if game['score_a'] == 1 else 'l' if game['score_a'] == 0 else 'd'] += 1
+                    if out is not None:
+                        out.write(json.dumps(game) + '\n')
+                if out is not None:
+                    out.flush()
+                scores.append(sum(game['score_a'] for game in pair_games) / 2)
+                llr = sprt_llr(scores, elo0, elo1)
+                if len(scores) < SPRT_MIN_PAIRS:
+                    continue
+                if llr <= lower:
+                    decision = 'H0'
+                elif llr >= upper:
+                    decision = 'H1'
+            n = len(scores) * 2
+            log(f"{n} games +{totals['w']} ={totals['d']} -{totals['l']}, elo {score_elo(sum(scores) / len(scores)):+.1f}, "
+                f"llr {llr:.2f} [{lower:.2f}, {upper:.2f}], {time.perf_counter() - start:.0f}s")
+    finally:
+        # a decided match doesn't need the pairs still in line
+        pool.shutdown(wait=True, cancel_futures=True)
+    mean = sum(scores) / len(scores) if scores else 0.5
+    return {'games': len(scores) * 2, **totals, 'score': mean, 'elo': score_elo(mean), 'llr': llr, 'decision': decision}
+
+def main():
+    parser = argparse.ArgumentParser(description='play two engine configurations against each other')
+    parser.add_argument('-a', default='', help='engine A, "key=value ..."')
+    parser.add_argument('-b', default='', help='engine B, "key=value ..."')
+    parser.add_argument('-g', '--games', type=int, default=MATCH_GAMES)
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('-o', '--out', help='write every game to this jsonl file')
+    parser.add_argument('-r', '--random-plies', type=int, default=RANDOM_PLIES)
+    parser.add_argument('--elo0', type=float, default=0)
+    parser.add_argument('--elo1', type=float, default=10)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    args = parser.parse_args()
+    try:
+        a, b = parse_engine(args.a), parse_engine(args.b)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.out, 'w') if args.out else None
+    try:
+        summary = run_match(a, b, games=args.games, workers=args.workers, out=out, elo0=args.elo0, elo1=args.elo1, alpha=args.alpha, beta=args.beta, plies=args.random_plies)
+    finally:
+        if out is not None:
+            out.close()
+    verdict = {'H0': f'H0 accepted, A is not {args.elo1} elo better', 'H1': f'H1 accepted, A is {args.elo1} elo better', None: 'undecided'}
+    print(f"{summary['games']} games, A scored {summary['score']:.3f} ({summary['elo']:+.1f} elo): {verdict[summary['decision']]}")
+
+if __name__ == "__main__":
+    main()
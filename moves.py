@@ -9,14 +9,15 @@ create move generation functions for:
 5. white rook
 6. black pawn
 
-Create move class:
-1. id of piece to move
-2. start row
-3. start col
-4. end row
-5. end col
-6. id of piece captured, else None
-7. promotion bool
+Moves are packed into a single int so generating them doesn't allocate objects:
+bits 0-5:   start square (r * 5 + c)
+bits 6-11:  end square
+bits 12-14: promotion (0 = none, 1 = rook, 2 = knight, 3 = king, 4 = bishop)
+bit 15:     capture
+bit 16:     enpassant, a white pawn double push that can be taken enpassant next move
+bit 17:     enpassant capture, the captured pawn is beside the start square not on the end square
+
+The captured piece is not stored in the move, make_board_move looks it up and keeps it on a stack for undo
 """
 
 from piece import Piece
@@ -24,28 +25,72 @@ from typing import List, Tuple
 
 ROWS, COLS = 8, 5
 
-class Move:
-    # track the piece, start, destination, captured piece, and if promotion
-    def __init__(self, piece: Piece, rs:int, cs:int, re:int, ce:int, capture: Piece, promotion: int, enpassant:bool, enpassant_cap:bool):
-        self.piece = piece
-        self.rs = rs
-        self.cs = cs
-        self.re = re
-        self.ce = ce
-        self.capture = capture
-        self.promotion = promotion
-        self.enpassant = enpassant
-        self.enpassant_cap = enpassant_cap
-    
-    def __str__(self):
-        if self.capture:
-            return f"{self.piece} ({self.rs+1}, {self.cs+1}) to ({self.re+1}, {self.ce+1}) [capture: {self.capture} ({self.capture.r+1}, {self.capture.c+1})]"
-        else:
-            return f"{self.piece} ({self.rs+1}, {self.cs+1}) to ({self.re+1}, {self.ce+1})"
+TO_SHIFT = 6
+PROMO_SHIFT = 12
+SQ_MASK = 0x3F
+PROMO_MASK = 0x7
+CAPTURE = 1 << 15
+ENPASSANT = 1 << 16
+ENPASSANT_CAP = 1 << 17
+
+NO_MOVE = 0 # a square to itself is never a real move
+
+# largest number of captures or quiet moves one side can have in a position (with room to spare)
+MAX_MOVES = 128
+
+PROMOTION_NAMES = ['', 'r', 'n', 'k', 'b']
+
+def encode_move(rs:int, cs:int, re:int, ce:int, promotion:int=0, flags:int=0) -> int:
+    return (rs * COLS + cs) | ((re * COLS + ce) << TO_SHIFT) | (promotion << PROMO_SHIFT) | flags
+
+def move_from(mv:int) -> int:
+    return mv & SQ_MASK
+
+def move_to(mv:int) -> int:
+    return (mv >> TO_SHIFT) & SQ_MASK
+
+def move_promotion(mv:int) -> int:
+    return (mv >> PROMO_SHIFT) & PROMO_MASK
+
+def move_start(mv:int) -> Tuple[int, int]:
+    # (rs, cs)
+    return divmod(mv & SQ_MASK, COLS)
+
+def move_end(mv:int) -> Tuple[int, int]:
+    # (re, ce)
+    return divmod((mv >> TO_SHIFT) & SQ_MASK, COLS)
+
+def move_str(mv:int) -> str:
+    rs, cs = move_start(mv)
+    re, ce = move_end(mv)
+    s = f"({rs+1}, {cs+1}) to ({re+1}, {ce+1})"
+    if mv & CAPTURE:
+        s += " [capture]"
+    if mv & ENPASSANT_CAP:
+        s += " [enpassant]"
+    if move_promotion(mv):
+        s += f" [promotion: {PROMOTION_NAMES[move_promotion(mv)]}]"
+    return s
+
+def move_text(mv:int) -> str:
+    # short form for text protocols (engine.py): column letter a-e and row 1-8 as in move_str, then the promotion
+    # "(8, 3) to (3, 3) [capture]" is c8c3, a pawn promoting to a rook on (1, 2) is b2b1r
+    rs, cs = move_start(mv)
+    re, ce = move_end(mv)
+    return f"{'abcde'[cs]}{rs+1}{'abcde'[ce]}{re+1}{PROMOTION_NAMES[move_promotion(mv)]}"
+
+def parse_move(text:str, mvs) -> int:
+    # the move of mvs written as text (move_text), None if there is none, the flags come from the generated move
+    for mv in mvs:
+        if move_text(mv) == text:
+            return mv
+    return None
 
 
 # Move generation functions
-def white_king_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tuple[List[Move], List[Move]]:
+# these work per piece and are used by the gui to show the moves of the selected piece,
+# the search uses the setwise generators in bitboard.py
+def white_king_moves(piece:Piece, board: List[List[Piece]], prev_mv: int) -> Tuple[List[int], List[int]]:
     moves = []
     captures = []
 
@@ -63,20 +108,20 @@ def white_king_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tu
             cap = board[nr][nc]
             if cap:
                 if cap.color != piece.color:
-                    captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=0, enpassant=False, enpassant_cap=False))
+                    captures.append(encode_move(piece.r, piece.c, nr, nc, flags=CAPTURE))
             else:
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=None, promotion=0, enpassant=False, enpassant_cap=False))
+                moves.append(encode_move(piece.r, piece.c, nr, nc))
 
 
     return (captures, moves)
 
-def white_knight_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tuple[List[Move], List[Move]]:
+def white_knight_moves(piece:Piece, board: List[List[Piece]], prev_mv: int) -> Tuple[List[int], List[int]]:
     moves = []
     captures = []
 
     # can move in jumping L directions
     d = [
-            (2, 1),     (1, 2), 
+            (2, 1),     (1, 2),
             (-2, 1),   (-1, 2),
             (2, -1),   (1, -2),
             (-2, -1), (-1, -2),
@@ -88,19 +133,19 @@ def white_knight_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) ->
 
         if nr < 0 or nr >= ROWS or nc < 0 or nc >= COLS:
                 continue
-        
+
         cap = board[nr][nc]
         if cap:
             if (cap.color != piece.color):
-                captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=0, enpassant=False, enpassant_cap=False))
+                captures.append(encode_move(piece.r, piece.c, nr, nc, flags=CAPTURE))
         else:
-            moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=None, promotion=0, enpassant=False, enpassant_cap=False))
+            moves.append(encode_move(piece.r, piece.c, nr, nc))
 
     return (captures, moves)
 
-def white_bishop_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tuple[List[Move], List[Move]]:
+def white_bishop_moves(piece:Piece, board: List[List[Piece]], prev_mv: int) -> Tuple[List[int], List[int]]:
     moves = []
-    captures = [] 
+    captures = []
 
     # diagonal directions!
     d = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
@@ -112,7 +157,7 @@ def white_bishop_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) ->
         while True:
             nr += dr
             nc += dc
-            
+
             if nr < 0 or nr >= ROWS or nc < 0 or nc >= COLS:
                 break
 
@@ -121,17 +166,17 @@ def white_bishop_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) ->
             if cap:
                 # but if there is a piece of other color here we can capture it
                 if cap.color != piece.color:
-                    captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=0, enpassant=False, enpassant_cap=False))
+                    captures.append(encode_move(piece.r, piece.c, nr, nc, flags=CAPTURE))
                 break
             else:
                 # no piece we keep movin!
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=None, promotion=0, enpassant=False, enpassant_cap=False))
+                moves.append(encode_move(piece.r, piece.c, nr, nc))
 
     return (captures, moves)
 
-def white_rook_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tuple[List[Move], List[Move]]:
+def white_rook_moves(piece:Piece, board: List[List[Piece]], prev_mv: int) -> Tuple[List[int], List[int]]:
     moves = []
-    captures = [] 
+    captures = []
 
     # only verical/horizontal
     d = [(1, 0), (-1, 0), (0, -1), (0, 1)]
@@ -143,7 +188,7 @@ def white_rook_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tu
         while True:
             nr += dr
             nc += dc
-            
+
             if nr < 0 or nr >= ROWS or nc < 0 or nc >= COLS:
                 break
 
@@ -152,33 +197,31 @@ def white_rook_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tu
             if cap:
                 # but if there is a piece of other color here we can capture it
                 if cap.color != piece.color:
-                    captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=0, enpassant=False, enpassant_cap=False))
+                    captures.append(encode_move(piece.r, piece.c, nr, nc, flags=CAPTURE))
                 break
             else:
                 # no piece we keep movin!
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=None, promotion=0, enpassant=False, enpassant_cap=False))
+                moves.append(encode_move(piece.r, piece.c, nr, nc))
 
     return (captures, moves)
 
-def white_pawn_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tuple[List[Move], List[Move]]:
+def white_pawn_moves(piece:Piece, board: List[List[Piece]], prev_mv: int) -> Tuple[List[int], List[int]]:
     moves = []
-    captures = [] 
+    captures = []
 
-    nr = piece.r - 1 
+    nr = piece.r - 1
     promotion = nr == 0
     if board[nr][piece.c] is None:
         if piece.r == 6:
-            moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=piece.c, capture=None, promotion=0, enpassant=False, enpassant_cap=False))
+            moves.append(encode_move(piece.r, piece.c, nr, piece.c))
             if board[nr-1][piece.c] is None:
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr-1, ce=piece.c, capture=None, promotion=0, enpassant=True, enpassant_cap=False))
+                moves.append(encode_move(piece.r, piece.c, nr-1, piece.c, flags=ENPASSANT))
         else:
             if promotion:
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=piece.c, capture=None, promotion=1, enpassant=False, enpassant_cap=False))
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=piece.c, capture=None, promotion=2, enpassant=False, enpassant_cap=False))
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=piece.c, capture=None, promotion=3, enpassant=False, enpassant_cap=False))
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=piece.c, capture=None, promotion=4, enpassant=False, enpassant_cap=False))
+                for promo in range(1, 5):
+                    moves.append(encode_move(piece.r, piece.c, nr, piece.c, promotion=promo))
             else:
-                moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=piece.c, capture=None, promotion=0, enpassant=False, enpassant_cap=False))
+                moves.append(encode_move(piece.r, piece.c, nr, piece.c))
 
     # check captures:
     for dc in [-1, 1]:
@@ -188,26 +231,24 @@ def white_pawn_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tu
         cap = board[nr][nc]
         if cap and (cap.color != piece.color):
             if promotion:
-                captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=1, enpassant=False, enpassant_cap=False))
-                captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=2, enpassant=False, enpassant_cap=False))
-                captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=3, enpassant=False, enpassant_cap=False))
-                captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=4, enpassant=False, enpassant_cap=False))
+                for promo in range(1, 5):
+                    captures.append(encode_move(piece.r, piece.c, nr, nc, promotion=promo, flags=CAPTURE))
             else:
-                captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=0, enpassant=False, enpassant_cap=False))
+                captures.append(encode_move(piece.r, piece.c, nr, nc, flags=CAPTURE))
 
     return (captures, moves)
 
-def black_pawn_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tuple[List[Move], List[Move]]:
+def black_pawn_moves(piece:Piece, board: List[List[Piece]], prev_mv: int) -> Tuple[List[int], List[int]]:
     # prev_mv will never be None since black moves second
     moves = []
-    captures = [] 
-    
+    captures = []
+
     nr = piece.r + 1
     if board[nr][piece.c] is None:
         if nr == ROWS-1:
-            captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=piece.c, capture=None, promotion=0, enpassant=False, enpassant_cap=False))
+            captures.append(encode_move(piece.r, piece.c, nr, piece.c))
         else:
-            moves.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=piece.c, capture=None, promotion=0,enpassant=False, enpassant_cap=False))
+            moves.append(encode_move(piece.r, piece.c, nr, piece.c))
 
     # check captures:
     for dc in [-1, 1]:
@@ -216,15 +257,15 @@ def black_pawn_moves(piece:Piece, board: List[List[Piece]], prev_mv: Move) -> Tu
             break
         cap = board[nr][nc]
         if cap and (cap.color != piece.color):
-            captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=cap, promotion=0, enpassant=False, enpassant_cap=False))
-        
-        if piece.r == 4:
-            # if we can see enpassants 
+            captures.append(encode_move(piece.r, piece.c, nr, nc, flags=CAPTURE))
+
+        if piece.r == 4 and prev_mv and prev_mv & ENPASSANT:
+            # if we can see enpassants
             enpassant_cap = board[piece.r][nc]
-            if enpassant_cap and (enpassant_cap.color != piece.color) and prev_mv.enpassant and enpassant_cap is prev_mv.piece:
+            if enpassant_cap and (enpassant_cap.color != piece.color) and move_to(prev_mv) == piece.r * COLS + nc:
                 # if there is a piece adjacent of opposite color, check if the previous move was enpassant and if it was the piece to move
-                captures.append(Move(piece=piece, rs=piece.r, cs=piece.c, re=nr, ce=nc, capture=enpassant_cap, promotion=0, enpassant=False, enpassant_cap=True))
-    
+                captures.append(encode_move(piece.r, piece.c, nr, nc, flags=CAPTURE | ENPASSANT_CAP))
+
 
 
-    return (captures, moves)
\ No newline at end of file
+    return (captures, moves)
@@ -0,0 +1,91 @@
+"""
+ordering.py
+Move ordering for the search, the better the first move the more alpha-beta prunes
+
+Order at every node:
+1. hash/PV move (handled by the search, it is its own stage)
+2. captures, most valuable victim first then least valuable attacker (MVV-LVA)
+3. killer moves, quiet moves that caused a beta cutoff at the same ply
+4. the rest of the quiet moves, by the history table [piece type][end square]
+
+The history table is aged (halved) between searches so old games don't drown out the current one
+"""
+
+import board as B
+from bitboard import SQ_RC
+from moves import SQ_MASK, TO_SHIFT, PROMO_SHIFT, PROMO_MASK, CAPTURE, ENPASSANT_CAP
+from piece import PIECE_VALUES
+
+MAX_PLY = 64
+NUM_KILLERS = 2 # fixed, order_quiets, update_quiet_cutoff and nega_max's killer stage are written for two slots
+
+# value of the piece a pawn promotes to, by promotion code (1 = rook, 2 = knight, 3 = king, 4 = bishop)
+PROMOTION_VALUES = [0, PIECE_VALUES[5], PIECE_VALUES[3], PIECE_VALUES[2], PIECE_VALUES[4]]
+
+killers = [[0] * NUM_KILLERS for _ in range(MAX_PLY)]
+history = [[0] * 40 for _ in range(6)] # [zobrist_id][end square]
+
+def capture_score(mv: int) -> int:
+    # MVV-LVA, a black pawn stepping onto the back rank wins the game so it goes first
+    if not mv & CAPTURE:
+        return 1000
+    rs, cs = SQ_RC[mv & SQ_MASK]
+    re, ce = SQ_RC[(mv >> TO_SHIFT) & SQ_MASK]
+    if mv & ENPASSANT_CAP:
+        victim = PIECE_VALUES[1]
+    else:
+        victim = PIECE_VALUES[B.board[re][ce].zobrist_id]
+    attacker = PIECE_VALUES[B.board[rs][cs].zobrist_id]
+    return victim * 16 - attacker + PROMOTION_VALUES[(mv >> PROMO_SHIFT) & PROMO_MASK] * 16
+
+def order_captures(buf, n: int):
+    # sort buf[0:n] in place, best first
+    if n > 1:
+        buf[:n] = sorted(buf[:n], key=capture_score, reverse=True)
+
+def order_quiets(buf, n: int, ply: int):
+    # killers first, then promotions, then by history
+    if n < 2:
+        return
+    killer_0, killer_1 = killers[ply]
+    def quiet_score(mv):
+        if mv == killer_0:
+            return 1 << 30
+        if mv == killer_1:
+            return 1 << 29
+        promotion = (mv >> PROMO_SHIFT) & PROMO_MASK
+        if promotion:
+            return (1 << 28) + PROMOTION_VALUES[promotion]
+        frm = mv & SQ_MASK
+        to = (mv >> TO_SHIFT) & SQ_MASK
+        rs, cs = SQ_RC[frm]
+        return history[B.board[rs][cs].zobrist_id][to]
+    buf[:n] = sorted(buf[:n], key=quiet_score, reverse=True)
+
+def update_quiet_cutoff(mv: int, ply: int, d: int):
+    # a quiet move caused a beta cutoff, remember it as a killer and credit its history
+    # called after the move is undone so the piece is back on its start square
+    ply_killers = killers[ply]
+    if ply_killers[0] != mv:
+        ply_killers[1] = ply_killers[0]
+        ply_killers[0] = mv
+    rs, cs = SQ_RC[mv & SQ_MASK]
+    history[B.board[rs][cs].zobrist_id][(mv >> TO_SHIFT) & SQ_MASK] += d * d
+
+def new_search():
+    # age the history so the new position matters more, killers are for the old tree so drop them
+    for row in history:
+        for i in range(len(row)):
+            row[i] >>= 1
+    for ply_killers in killers:
+        for i in range(NUM_KILLERS):
+            ply_killers[i] = 0
+
+def clear():
+    # forget everything, so a search doesn't depend on what was searched before it (benchmarks)
+    for row in history:
+        for i in range(len(row)):
+            row[i] = 0
+    for ply_killers in killers:
+        for i in range(NUM_KILLERS):
+            ply_killers[i] = 0
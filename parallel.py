@@ -0,0 +1,194 @@
+"""
+parallel.py
+Root splitting, the root moves are searched by a pool of worker processes
+
+Every worker is its own process so it has its own copy of the board module state (board, piece_lst, bitboards...),
+a root move is sent as the position string (board.board_to_str) plus the move. The worker loads the position,
+plays the move and searches it with nega_max.
+
+The best score so far is a shared value, a worker reads it when it starts a move so moves that start later
+get a narrower window. The first root move (the best move of the last iteration) is searched here before anything
+is handed out so the workers start with a real alpha.
+
+Workers search with alpha - 1 so a move that ties the best score comes back exact instead of as a bound,
+that way picking the first move (in search order) with the best score gives the same move as nega_max_root.
+
+Lazy SMP is the other mode: every helper runs the whole iterative deepening search on the same position, they
+only share a transposition table in shared memory (zobrist_hashing.tt_shared). What one finds the others get from
+the table. Odd helpers start a depth ahead so they aren't all in the same iteration, the deepest completed iteration
+of any process is played.
+"""
+
+import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import board as B
+import search as S
+from zobrist_hashing import TranspositionTable, tt_new_search, tt_shared, tt_attach, tt_close, TT_SIZE_MB
+
+WORKER_TT_MB = 16 # every worker has its own table
+
+# worker process state, set by _init_worker
+_shared_alpha = None
+_zb = None
+_tt = None
+_position = None # (position, prev_move) of the last task, a new root position starts a new search
+
+def _init_worker(shared_alpha, zb):
+    global _shared_alpha
+    global _zb
+    global _tt
+    _shared_alpha = shared_alpha
+    _zb = zb
+    if zb is not None:
+        _tt = TranspositionTable(size_mb=WORKER_TT_MB)
+
+def make_pool(workers:int=None, zb=None) -> ProcessPoolExecutor:
+    # a pool for nega_max_root_parallel, one worker per core by default
+    # pass zb to give every worker a transposition table
+    shared_alpha = mp.Value('i', -1001)
+    pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker, initargs=(shared_alpha, zb))
+    pool.shared_alpha = shared_alpha
+    return pool
+
+def _search_root_move(position:str, prev_move:int, mv:int, d:int, beta:int, time_left:float):
+    # runs in a worker, returns (move, score or None if it wasn't searched, stats counters)
+    # raises SearchAbort if the time runs out
+    global _position
+    turn = B.load_board_str(position, prev_move)
+    if _position != (position, prev_move):
+        _position = (position, prev_move)
+        S.new_search()
+        if _tt is not None:
+            tt_new_search(_tt)
+    S.stats.reset()
+    S.deadline = time.perf_counter() + time_left if time_left else 0.0
+    alpha = _shared_alpha.value
+    if alpha >= beta: # another move already cut off
+        return (mv, None, {})
+    board_zb_hash = B.calculate_zb_hash(_zb, turn) if _zb is not None else None
+    child_hash = B.make_board_move(mv=mv, zb=_zb, board_zb_hash=board_zb_hash)
+    val_flip = 1 if turn else -1
+    try:
+        val = -1 * S.nega_max(prev_move=mv, d=d-1, alpha=-1*beta, beta=-1*(alpha-1), val_flip=val_flip*-1, turn=not turn, zb=_zb, board_zb_hash=child_hash, ply=1, tt=_tt)
+    finally:
+        S.deadline = 0.0
+    with _shared_alpha.get_lock():
+        if val > _shared_alpha.value:
+            _shared_alpha.value = val
+    return (mv, val, S.stats.counters())
+
+def nega_max_root_parallel(prev_move: int, d:int, alpha: int, beta:int, turn:bool, pool:ProcessPoolExecutor, zb=None, board_zb_hash=None, tt=None, first_move:int=None) -> int:
+    # same as search.nega_max_root but the moves after the first are searched by the pool
+    # limits come from the search module (S.deadline), the workers get the time that is left
+    if d <= 1:
+        return S.nega_max_root(prev_move=prev_move, d=d, alpha=alpha, beta=beta, turn=turn, zb=zb, board_zb_hash=board_zb_hash, tt=tt, first_move=first_move)
+    S.root_best_move = None
+    if B.check_win():
+        return None
+    mvs = S.root_moves(prev_move=prev_move, turn=turn, board_zb_hash=board_zb_hash, tt=tt, first_move=first_move)
+    if not mvs: # no moves aka stalemate
+        return None
+
+    # the first move here, it sets the window for the rest
+    val_flip = 1 if turn else -1
+    first = mvs[0]
+    child_hash = B.make_board_move(mv=first, zb=zb, board_zb_hash=board_zb_hash)
+    try:
+        score = -1 * S.nega_max(prev_move=first, d=d-1, alpha=-1*beta, beta=-1*alpha, val_flip=val_flip*-1, turn=not turn, zb=zb, board_zb_hash=child_hash, ply=1, tt=tt)
+    finally:
+        B.undo_board_move(mv=first)
+    S.root_best_move, S.root_score = first, score
+    if score >= beta or len(mvs) == 1:
+        if S.reporter is not None:
+            S.reporter({'event': 'root', 'depth': d, 'score': score, 'move': first})
+        return first
+
+    # the rest in parallel
+    pool.shared_alpha.value = max(score, alpha)
+    position = B.board_to_str(turn)
+    time_left = S.deadline - time.perf_counter() if S.deadline else None
+    order = {mv: i for (i, mv) in enumerate(mvs)}
+    best = (score, 0) # (score, -search order), the earlier move wins a tie like in nega_max_root
+    aborted = False
+    futures = {pool.submit(_search_root_move, position, prev_move, mv, d, beta, time_left) for mv in mvs[1:]}
+    try:
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    mv, val, counters = future.result()
+                except S.SearchAbort:
+                    aborted = True
+                    continue
+                S.stats.add(counters)
+                if val is None:
+                    continue
+                if (val, -order[mv]) > best:
+                    best = (val, -order[mv])
+                    S.root_best_move, S.root_score = mv, val
+            if best[0] >= beta:
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+    if aborted:
+        raise S.SearchAbort()
+    if S.reporter is not None:
+        S.reporter({'event': 'root', 'depth': d, 'score': S.root_score, 'move': S.root_best_move})
+    return S.root_best_move
+
+
+# Lazy SMP
+
+def _init_smp_worker(stop, zb, tt_name:str, n:int):
+    global _zb
+    global _tt
+    S.stop = stop
+    _zb = zb
+    _tt = tt_attach(tt_name, n)
+
+def make_smp_pool(workers:int=None, zb=None, size_mb:int=TT_SIZE_MB) -> ProcessPoolExecutor:
+    # a pool of lazy smp helpers, the calling process searches too so one less helper than cores by default
+    # pool.tt is the shared table for the calling process, close it with close_smp_pool
+    tt = tt_shared(size_mb)
+    stop = mp.Value('b', 0)
+    pool = ProcessPoolExecutor(max_workers=workers or max(1, os.cpu_count() - 1), initializer=_init_smp_worker, initargs=(stop, zb, tt.shm.name, len(tt)))
+    pool.tt = tt
+    pool.stop = stop
+    pool.helpers = workers or max(1, os.cpu_count() - 1)
+    return pool
+
+def close_smp_pool(pool:ProcessPoolExecutor):
+    pool.shutdown()
+    tt_close(pool.tt, unlink=True)
+
+def _smp_search(position:str, prev_move:int, max_depth:int, time_limit:float, node_limit:int, helper:int, tt_age:int):
+    # runs in a helper, returns (deepest completed depth, its move, its score, stats counters)
+    turn = B.load_board_str(position, prev_move)
+    board_zb_hash = B.calculate_zb_hash(_zb, turn)
+    mv = S.iterative_deepening(prev_move=prev_move, turn=turn, max_depth=max_depth, time_limit=time_limit, node_limit=node_limit, zb=_zb, board_zb_hash=board_zb_hash, tt=_tt, start_depth=1 + helper % 2, tt_age=tt_age)
+    return (S.completed_depth, mv, S.completed_score, S.stats.counters())
+
+def lazy_smp(prev_move: int, turn:bool, pool:ProcessPoolExecutor, max_depth:int=S.MAX_PLY-1, time_limit:float=None, node_limit:int=None, zb=None, board_zb_hash=None) -> int:
+    # iterative deepening here and in every helper of the pool (make_smp_pool) at once, all on pool.tt
+    # returns the move of the deepest completed iteration, the node limit is per process
+    pool.stop.value = 0
+    # one new age for the search, every process stores with it (each has its own copy of the table's age)
+    tt_new_search(pool.tt)
+    position = B.board_to_str(turn)
+    futures = [pool.submit(_smp_search, position, prev_move, max_depth, time_limit, node_limit, helper, pool.tt.age) for helper in range(pool.helpers)]
+    try:
+        mv = S.iterative_deepening(prev_move=prev_move, turn=turn, max_depth=max_depth, time_limit=time_limit, node_limit=node_limit, zb=zb, board_zb_hash=board_zb_hash, tt=pool.tt, tt_age=pool.tt.age)
+    finally:
+        # we are done, so are the helpers
+        pool.stop.value = 1
+    best = (S.completed_depth, mv, S.completed_score)
+    for future in futures:
+        depth, helper_mv, score, counters = future.result()
+        S.stats.add(counters)
+        if depth > best[0] and helper_mv is not None:
+            best = (depth, helper_mv, score)
+    S.completed_depth, mv, S.completed_score = best
+    return mv
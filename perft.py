@@ -0,0 +1,127 @@
+"""
+perft.py
+Count the leaf nodes of the move tree to a fixed depth, to check and time move generation
+
+Usage: python3 perft.py [back rank] [depth] [-d] [-p N] [-r] [-c]
+back rank: white's back rank like fill_board takes it ("knrb "), quote it because of the space
+-d: divide, print the count under each root move
+-p N: split the root moves over N processes
+-r: use the per piece generators in moves.py (Piece.get_moves) instead of the bitboard generators
+-c: check every setup in perft.json against its known counts
+
+A won/lost position (check_win) has no moves, so it counts as a leaf only at the last depth.
+After every root move the position (board string) has to be the same as before, otherwise make/undo broke something.
+"""
+
+import sys
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+import board as B
+from moves import move_str
+
+PERFT_FILE = 'perft.json'
+
+def reference_moves(turn: bool, prev_move: int):
+    # the same moves as get_player_moves, from each piece's own generator
+    caps = []
+    quiets = []
+    for pc in B.piece_lst:
+        if pc.color == turn and not pc.is_captured():
+            pc_caps, pc_quiets = pc.get_moves(B.board, prev_move)
+            caps += pc_caps
+            quiets += pc_quiets
+    return (caps, quiets)
+
+def perft(d: int, turn: bool, prev_move: int, gen=B.get_player_moves) -> int:
+    if d == 0:
+        return 1
+    if B.check_win():
+        return 0
+    caps, quiets = gen(turn, prev_move)
+    if d == 1:
+        return len(caps) + len(quiets)
+    n = 0
+    for mvs in (caps, quiets):
+        for mv in mvs:
+            B.make_board_move(mv=mv)
+            n += perft(d - 1, not turn, mv, gen)
+            B.undo_board_move(mv=mv)
+    return n
+
+def divide(d: int, turn: bool, prev_move: int, gen=B.get_player_moves):
+    # [(root move, count)], checks the board comes back the same after each root move
+    position = B.board_to_str(turn)
+    caps, quiets = gen(turn, prev_move)
+    counts = []
+    for mv in caps + quiets:
+        B.make_board_move(mv=mv)
+        counts.append((mv, perft(d - 1, not turn, mv, gen)))
+        B.undo_board_move(mv=mv)
+        if B.board_to_str(turn) != position:
+            raise RuntimeError(f'board changed after make/undo of {move_str(mv)}')
+    return counts
+
+def _perft_root_move(position: str, prev_move: int, mv: int, d: int, reference: bool):
+    # runs in a worker process
+    turn = B.load_board_str(position, prev_move)
+    B.make_board_move(mv=mv)
+    return (mv, perft(d - 1, not turn, mv, reference_moves if reference else B.get_player_moves))
+
+def divide_parallel(d: int, turn: bool, prev_move: int, workers: int, reference: bool=False):
+    position = B.board_to_str(turn)
+    caps, quiets = B.get_player_moves(turn, prev_move)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_perft_root_move, position, prev_move, mv, d, reference) for mv in caps + quiets]
+        return [future.result() for future in futures]
+
+def run(back_rank: str, d: int, show_divide: bool=False, workers: int=0, reference: bool=False) -> int:
+    B.fill_board(white_back_rank=back_rank)
+    gen = reference_moves if reference else B.get_player_moves
+    start = time.perf_counter()
+    if d == 0 or B.check_win():
+        counts = [(None, perft(d, True, None, gen))]
+    elif workers:
+        counts = divide_parallel(d, True, None, workers, reference)
+    else:
+        counts = divide(d, True, None, gen)
+    elapsed = time.perf_counter() - start
+    total = sum(n for (_, n) in counts)
+    if show_divide:
+        for (mv, n) in counts:
+            if mv is not None:
+                print(f'{move_str(mv)}: {n}')
+    print(f'perft({d}) "{back_rank}": {total} nodes, {elapsed:.2f}s, {total / max(elapsed, 1e-9):.0f} nps')
+    return total
+
+def check(fname=PERFT_FILE, workers: int=0, reference: bool=False) -> bool:
+    # run every setup in the fixture file to the depths it has counts for
+    with open(fname) as f:
+        known = json.load(f)
+    ok = True
+    for back_rank, counts in known.items():
+        for d, expected in enumerate(counts, start=1):
+            got = run(back_rank, d, workers=workers, reference=reference)
+            if got != expected:
+                print(f'MISMATCH perft({d}) "{back_rank}": expected {expected}')
+                ok = False
+    return ok
+
+def main():
+    args = sys.argv[1:]
+    show_divide = '-d' in args
+    reference = '-r' in args
+    workers = 0
+    if '-p' in args:
+        workers = int(args[args.index('-p') + 1])
+        del args[args.index('-p'):args.index('-p') + 2]
+    if '-c' in args:
+        sys.exit(0 if check(workers=workers, reference=reference) else 1)
+    args = [a for a in args if a not in ('-d', '-r')]
+    if len(args) != 2:
+        print(__doc__)
+        sys.exit(1)
+    run(args[0], int(args[1]), show_divide=show_divide, workers=workers, reference=reference)
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,9 @@ Create piece class:
 import numpy as np
 from typing import List, Tuple
 
+# piece values by zobrist_id (bp, wp, wk, wn, wb, wr), same as the piece_val in each evaluation function
+PIECE_VALUES = [1, 1, 2, 4, 3, 5]
+
 class Piece:
     # init a piece obj, should mostly stay the same except updates over time
     def __init__(self, id:int, r:int, c:int, color:bool, png:str, move_generator, evaluation_function, zobrist_id:int):
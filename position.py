@@ -0,0 +1,610 @@
+"""
+position.py
+A game position: the board, the pieces, capture counters, bitboards and the undo stacks in one object
+
+Position holds everything make/undo, move generation and evaluation touch, so a process can keep as many games
+as it likes (one Position each). board.py is the old module API over a default Position.
+
+Copying: copy() duplicates the pieces and lists (no deepcopy), a Position also pickles as is.
+For another process the position string (to_str/load_str) is the cheapest, it just loses the undo stacks.
+"""
+import copy
+import random
+from typing import List, Tuple
+import numpy as np
+from piece import Piece, black_pawn_evaluation, white_pawn_evaluation, white_knight_evaluation, white_bishop_evaluation, white_king_evaluation, white_rook_evaluation
+from moves import MAX_MOVES, SQ_MASK, TO_SHIFT, PROMO_SHIFT, PROMO_MASK, CAPTURE, ENPASSANT, ENPASSANT_CAP, black_pawn_moves, white_pawn_moves, white_knight_moves, white_bishop_moves, white_king_moves, white_rook_moves
+from bitboard import white_moves, black_moves, white_captures, black_captures, white_quiets, black_quiets, piece_attacks, SQ_RC, BP_CAP_LEFT_FROM, BP_CAP_RIGHT_FROM
+
+ROWS, COLS = 8, 5
+
+# zobrist rows for the side to move and enpassant keys (see zobrist_hashing.py)
+ZB_SIDE = 6
+ZB_EP = 7
+
+# Position strings, used to hand a position to another process
+# rows top to bottom separated by '/', then the side to move (w/b)
+# p is a black pawn, P K N B R are white pieces, . is empty
+# start position: "ppppp/ppppp/ppppp/...../...../...../PPPPP/KNRB. w"
+PIECE_CHARS = 'pPKNBR' # by zobrist_id
+PIECE_TYPES = [ # (png, move generator, evaluation function) by zobrist_id
+    ('bp', black_pawn_moves, black_pawn_evaluation),
+    ('wp', white_pawn_moves, white_pawn_evaluation),
+    ('wk', white_king_moves, white_king_evaluation),
+    ('wn', white_knight_moves, white_knight_evaluation),
+    ('wb', white_bishop_moves, white_bishop_evaluation),
+    ('wr', white_rook_moves, white_rook_evaluation),
+]
+
+class Position:
+    def __init__(self, white_back_rank=None):
+        # empty board until fill/load_str, unless a back rank is given
+        self.board = [[None] * COLS for _ in range(ROWS)]
+        self.piece_lst = [None] * 24 # black pieces are 0-14, white pieces are 15-23
+        self.w_captured = 0
+        self.b_captured = 0
+
+        # bitboards, kept in sync with board by fill and make/undo
+        self.bb = [0] * 6 # one per piece type, indexed by zobrist_id (bp, wp, wk, wn, wb, wr)
+        self.occ = [0, 0] # occupancy by color, occ[False] is black and occ[True] is white
+
+        # moves don't know what they captured, make_move pushes the captured piece (or None) here for undo
+        self.captured_stack = []
+
+        # squares each piece could capture on (0 if captured), kept up to date by make/undo so evaluate
+        # doesn't have to generate moves, sliders are only recomputed when a changed square is in their attacks
+        self.attacks = [0] * 24
+
+        # file of a white pawn that can be taken enpassant right now (-1 if none), it is part of the hash
+        # make_move pushes the old value here for undo
+        self.ep_file = -1
+        self.ep_stack = []
+
+        # zobrist hash, set by calculate_zb_hash and by make_move when it is given the keys (None otherwise),
+        # make_move pushes the old value here and undo_move puts it back
+        self.hash = None
+        self.hash_stack = []
+
+        # scratch space for evaluate so the leaves don't allocate
+        self._cap_counts = [0] * 24 # [# of captures I can make]
+        self._hit_counts = [0] * 24 # [# of moves to capture me]
+        self._capture_data = [0, 0]
+
+        if white_back_rank is not None:
+            self.fill(white_back_rank)
+
+    # Make the initial board state, if not given a back rank for white it will randomize
+    # white_back_rank format, must contain all 4 pieces: " knbr", or "r bnk", ect...
+    def fill(self, white_back_rank=None):
+        # white_back_rank has to be 'knrb ' in some order, checked before the position is touched
+        if white_back_rank is not None and sorted(white_back_rank) != sorted('knrb '):
+            raise ValueError(f'bad back rank {white_back_rank!r}, expected the letters of "knrb " in some order')
+        # clear anything left over from a previous game
+        self._clear()
+        board = self.board
+        piece_lst = self.piece_lst
+
+        # initiate black pieces
+        i = 0
+        for r in range(3):
+            for c in range(COLS):
+                piece = Piece(id=i, r=r, c=c, color=False, png='bp',
+                              move_generator=black_pawn_moves,
+                              evaluation_function=black_pawn_evaluation,
+                              zobrist_id=0)
+                piece_lst[i] = piece
+                board[r][c] = piece
+                i +=1
+
+        # initiate white pawns on 7th rank (r = 6)
+        for c in range(COLS):
+            piece = Piece(id=i, r=6, c=c, color=True, png='wp',
+                          move_generator=white_pawn_moves,
+                          evaluation_function=white_pawn_evaluation,
+                          zobrist_id=1)
+            piece_lst[i] = piece
+            board[6][c] = piece
+            i += 1
+
+        # make the back rank
+        # initalize the pieces
+        king = Piece(id=i, r=7, c=0, color=True, png='wk',
+                     move_generator=white_king_moves,
+                     evaluation_function=white_king_evaluation,
+                     zobrist_id=2)
+        piece_lst[i] = king
+
+        knight = Piece(id=i+1, r=7, c=0, color=True, png='wn',
+                       move_generator=white_knight_moves,
+                       evaluation_function=white_knight_evaluation,
+                       zobrist_id=3)
+        piece_lst[i+1] = knight
+
+        bishop = Piece(id=i+2, r=7, c=0, color=True, png='wb',
+                       move_generator=white_bishop_moves,
+                       evaluation_function=white_bishop_evaluation,
+                       zobrist_id=4)
+        piece_lst[i+2] = bishop
+
+        rook = Piece(id=i+3, r=7, c=0, color=True, png='wr',
+                     move_generator=white_rook_moves,
+                     evaluation_function=white_rook_evaluation,
+                     zobrist_id=5)
+        piece_lst[i+3] = rook
+
+        if white_back_rank is None:
+            char_list = list('knrb ')
+            random.shuffle(char_list)
+            white_back_rank = "".join(char_list)
+
+        back_rank_pieces = {'k': king, 'n': knight, 'b': bishop, 'r': rook}
+        c = 0
+        for char in white_back_rank:
+            if char == " ":
+                c += 1
+                continue
+            if char in back_rank_pieces:
+                piece = back_rank_pieces[char]
+                piece.c = c
+                board[7][c] = piece
+                c += 1
+
+        self._sync_bitboards()
+
+    def _clear(self):
+        # empty the board in place, board.py hands out these same lists
+        for row in self.board:
+            for c in range(COLS):
+                row[c] = None
+        for i in range(6):
+            self.bb[i] = 0
+        self.occ[0], self.occ[1] = 0, 0
+        self.w_captured, self.b_captured = 0, 0
+        self.captured_stack.clear()
+        self.ep_file = -1
+        self.ep_stack.clear()
+        self.hash = None
+        self.hash_stack.clear()
+
+    def _sync_bitboards(self):
+        # fill the bitboards and attack maps from the placed pieces
+        board = self.board
+        bb = self.bb
+        occ = self.occ
+        for pc in self.piece_lst:
+            if pc.c != -1 and board[pc.r][pc.c] is pc:
+                sq_bit = 1 << (pc.r * COLS + pc.c)
+                bb[pc.zobrist_id] |= sq_bit
+                occ[pc.color] |= sq_bit
+        all_occ = occ[0] | occ[1]
+        for pc in self.piece_lst:
+            self.attacks[pc.id] = 0 if pc.is_captured() else piece_attacks(pc.zobrist_id, pc.r * COLS + pc.c, all_occ)
+
+    def to_str(self, turn:bool) -> str:
+        rows = []
+        for row in self.board:
+            rows.append(''.join(PIECE_CHARS[pc.zobrist_id] if pc else '.' for pc in row))
+        return '/'.join(rows) + (' w' if turn else ' b')
+
+    def load_str(self, position:str, prev_move:int=None) -> bool:
+        # set up the position from a to_str string, returns the side to move
+        # prev_move is the move that led here, it decides if an enpassant capture is possible
+        # the white pieces keep their usual ids (pawns 15-19, then k n b r), any extra piece is a promoted pawn
+        if len(position.split()) != 2:
+            raise ValueError(f'bad position string: {position}')
+        rows, side = position.split()
+        rows = rows.split('/')
+        if len(rows) != ROWS or any(len(row) != COLS for row in rows) or side not in ('w', 'b'):
+            raise ValueError(f'bad position string: {position}')
+
+        black_ids = list(range(15))
+        pawn_ids = list(range(15, 20))
+        back_rank_ids = {2: 20, 3: 21, 4: 22, 5: 23} # original king, knight, bishop, rook
+        placed = []
+        for r, row in enumerate(rows):
+            for c, char in enumerate(row):
+                if char == '.':
+                    continue
+                if char not in PIECE_CHARS:
+                    raise ValueError(f'bad piece {char!r} in position string: {position}')
+                zobrist_id = PIECE_CHARS.index(char)
+                if zobrist_id == 1 and r in (0, ROWS - 1):
+                    # promotes on row 0 and starts on row 6, the move generators and tablebase.tb_index expect rows 1-6
+                    raise ValueError(f'white pawn on row {r} in position string: {position}')
+                if zobrist_id == 0:
+                    ids = black_ids
+                elif zobrist_id in back_rank_ids and back_rank_ids[zobrist_id] is not None:
+                    ids = [back_rank_ids[zobrist_id]]
+                    back_rank_ids[zobrist_id] = None
+                else:
+                    ids = pawn_ids
+                if not ids:
+                    raise ValueError(f'too many pieces in position string: {position}')
+                placed.append((ids.pop(0), r, c, zobrist_id))
+        # the string is good, only now is the old position thrown away
+        self._clear()
+
+        # everything not on the board is captured
+        for i in black_ids:
+            placed.append((i, -1, -1, 0))
+        for i in pawn_ids:
+            placed.append((i, -1, -1, 1))
+        for zobrist_id, i in back_rank_ids.items():
+            if i is not None:
+                placed.append((i, -1, -1, zobrist_id))
+        for (i, r, c, zobrist_id) in placed:
+            png, move_generator, evaluation_function = PIECE_TYPES[zobrist_id]
+            piece = Piece(id=i, r=r, c=c, color=i >= 15, png=png,
+                          move_generator=move_generator,
+                          evaluation_function=evaluation_function,
+                          zobrist_id=zobrist_id)
+            self.piece_lst[i] = piece
+            if r != -1:
+                self.board[r][c] = piece
+        self.b_captured = len(black_ids)
+        self.w_captured = len(pawn_ids) + sum(i is not None for i in back_rank_ids.values())
+
+        self._sync_bitboards()
+        if prev_move and prev_move & ENPASSANT:
+            self.ep_file = self._capturable_ep_file((prev_move >> TO_SHIFT) & SQ_MASK)
+        return side == 'w'
+
+    def copy(self) -> 'Position':
+        # an independent position, the pieces are copied so make/undo on one doesn't move the other's
+        pos = Position()
+        pieces = [copy.copy(pc) for pc in self.piece_lst]
+        pos.piece_lst[:] = pieces
+        for pc in pieces:
+            if pc.c != -1 and self.board[pc.r][pc.c] is self.piece_lst[pc.id]:
+                pos.board[pc.r][pc.c] = pc
+        pos.bb[:] = self.bb
+        pos.occ[:] = self.occ
+        pos.attacks[:] = self.attacks
+        pos.captured_stack[:] = [None if pc is None else pieces[pc.id] for pc in self.captured_stack]
+        pos.ep_stack[:] = self.ep_stack
+        pos.hash_stack[:] = self.hash_stack
+        pos.w_captured, pos.b_captured = self.w_captured, self.b_captured
+        pos.ep_file = self.ep_file
+        pos.hash = self.hash
+        return pos
+
+    def _update_slider_attacks(self, changed: int):
+        # recompute the bishops/rooks (promoted ones too) that can see one of the changed squares
+        occ = self.occ
+        bb = self.bb
+        board = self.board
+        attacks = self.attacks
+        all_occ = occ[0] | occ[1]
+        sliders = bb[4] | bb[5]
+        while sliders:
+            low = sliders & -sliders
+            sliders ^= low
+            sq = low.bit_length() - 1
+            r, c = SQ_RC[sq]
+            pc = board[r][c]
+            if attacks[pc.id] & changed:
+                attacks[pc.id] = piece_attacks(pc.zobrist_id, sq, all_occ)
+
+    def _capturable_ep_file(self, to: int) -> int:
+        # file of a double pushed pawn on square to if a black pawn is beside it to take it enpassant, else -1
+        ep_c = to % COLS
+        pawns = self.bb[0]
+        if ep_c + 1 < COLS and pawns & BP_CAP_LEFT_FROM & (1 << (to + 1)):
+            return ep_c
+        if ep_c - 1 >= 0 and pawns & BP_CAP_RIGHT_FROM & (1 << (to - 1)):
+            return ep_c
+        return -1
+
+    def make_move(self, mv: int, zb=None, board_zb_hash=None):
+        board = self.board
+        bb = self.bb
+        occ = self.occ
+        attacks = self.attacks
+
+        frm = mv & SQ_MASK
+        to = (mv >> TO_SHIFT) & SQ_MASK
+        rs, cs = SQ_RC[frm]
+        re, ce = SQ_RC[to]
+        piece = board[rs][cs]
+
+        frm_bit = 1 << frm
+        to_bit = 1 << to
+        bb[piece.zobrist_id] ^= frm_bit | to_bit
+        occ[piece.color] ^= frm_bit | to_bit
+
+        capture = None
+        cap_bit = 0
+        if mv & CAPTURE:
+            # an enpassant capture takes the pawn beside us, not the one on the end square
+            cr = rs if mv & ENPASSANT_CAP else re
+            capture = board[cr][ce]
+            board[cr][ce] = None
+            cap_bit = 1 << (cr * COLS + ce)
+            attacks[capture.id] = 0
+            bb[capture.zobrist_id] ^= cap_bit
+            occ[capture.color] ^= cap_bit
+            capture.r, capture.c = -1, -1
+            if capture.color: # if white we increment
+                self.w_captured += 1
+            else:
+                self.b_captured += 1
+        self.captured_stack.append(capture)
+
+        piece.r, piece.c = re, ce
+        board[re][ce] = piece
+        board[rs][cs] = None
+
+        # promote the piece, changing important piece data:
+        promotion = (mv >> PROMO_SHIFT) & PROMO_MASK
+        if promotion:
+            bb[piece.zobrist_id] ^= to_bit # pawn leaves the pawn bitboard, added back below
+        match promotion:
+            case 1:
+                piece.png = 'wr'
+                piece.move_generator = white_rook_moves
+                piece.evaluation_function = white_rook_evaluation
+                piece.zobrist_id = 5
+            case 2:
+                piece.png = 'wn'
+                piece.move_generator = white_knight_moves
+                piece.evaluation_function = white_knight_evaluation
+                piece.zobrist_id = 3
+            case 3:
+                piece.png = 'wk'
+                piece.move_generator = white_king_moves
+                piece.evaluation_function = white_king_evaluation
+                piece.zobrist_id = 2
+            case 4:
+                piece.png = 'wb'
+                piece.move_generator = white_bishop_moves
+                piece.evaluation_function = white_bishop_evaluation
+                piece.zobrist_id = 4
+        if promotion:
+            bb[piece.zobrist_id] ^= to_bit
+
+        attacks[piece.id] = piece_attacks(piece.zobrist_id, to, occ[0] | occ[1])
+        self._update_slider_attacks(frm_bit | to_bit | cap_bit)
+
+        # the enpassant chance only lasts one move
+        old_ep = self.ep_file
+        self.ep_stack.append(old_ep)
+        ep_file = self._capturable_ep_file(to) if mv & ENPASSANT else -1
+        self.ep_file = ep_file
+
+        # calc new hash now since after promotion to keep promotion data
+        self.hash_stack.append(self.hash)
+        self.hash = None
+        if zb is not None:
+            board_zb_hash = update_board_zb_hash(zb=zb, board_zb_hash=board_zb_hash, mv=mv, piece=piece, capture=capture)
+            board_zb_hash = board_zb_hash ^ zb[ZB_SIDE][0]
+            if old_ep >= 0:
+                board_zb_hash = board_zb_hash ^ zb[ZB_EP][old_ep]
+            if ep_file >= 0:
+                board_zb_hash = board_zb_hash ^ zb[ZB_EP][ep_file]
+            self.hash = board_zb_hash
+        return board_zb_hash
+
+    def undo_move(self, mv: int, zb=None, board_zb_hash=None):
+        # reset positions! and piece data
+        board = self.board
+        bb = self.bb
+        occ = self.occ
+        attacks = self.attacks
+
+        frm = mv & SQ_MASK
+        to = (mv >> TO_SHIFT) & SQ_MASK
+        rs, cs = SQ_RC[frm]
+        re, ce = SQ_RC[to]
+        piece = board[re][ce]
+        capture = self.captured_stack.pop()
+        old_ep = self.ep_stack.pop()
+
+        # calc new hash now since before promotion and before promotion data is lost
+        if zb is not None:
+            ep_file = self.ep_file
+            board_zb_hash = update_board_zb_hash(zb=zb, board_zb_hash=board_zb_hash, mv=mv, piece=piece, capture=capture)
+            board_zb_hash = board_zb_hash ^ zb[ZB_SIDE][0]
+            if ep_file >= 0:
+                board_zb_hash = board_zb_hash ^ zb[ZB_EP][ep_file]
+            if old_ep >= 0:
+                board_zb_hash = board_zb_hash ^ zb[ZB_EP][old_ep]
+        self.ep_file = old_ep
+        self.hash = self.hash_stack.pop()
+
+        frm_bit = 1 << frm
+        to_bit = 1 << to
+        occ[piece.color] ^= frm_bit | to_bit
+        if mv & (PROMO_MASK << PROMO_SHIFT): # the promoted piece goes back to being a pawn on the start square
+            bb[piece.zobrist_id] ^= to_bit
+            bb[1] ^= frm_bit
+        else:
+            bb[piece.zobrist_id] ^= frm_bit | to_bit
+
+        piece.r, piece.c = rs, cs
+        board[rs][cs] = piece
+        board[re][ce] = None
+
+        # restore captured piece
+        cap_bit = 0
+        if capture:
+            if mv & ENPASSANT_CAP:
+                capture.r, capture.c = rs, ce
+                board[rs][ce] = capture
+            else:
+                capture.r, capture.c = re, ce
+                board[re][ce] = capture
+            cap_bit = 1 << (capture.r * COLS + capture.c)
+            bb[capture.zobrist_id] |= cap_bit
+            occ[capture.color] |= cap_bit
+
+            if capture.color: # if white we decrement
+                self.w_captured -= 1
+            else:
+                self.b_captured -= 1
+
+        # restore promotion
+        if mv & (PROMO_MASK << PROMO_SHIFT):
+            piece.png = 'wp'
+            piece.move_generator = white_pawn_moves
+            piece.evaluation_function = white_pawn_evaluation
+            piece.zobrist_id = 1
+
+        all_occ = occ[0] | occ[1]
+        attacks[piece.id] = piece_attacks(piece.zobrist_id, frm, all_occ)
+        if capture:
+            attacks[capture.id] = piece_attacks(capture.zobrist_id, capture.r * COLS + capture.c, all_occ)
+        self._update_slider_attacks(frm_bit | to_bit | cap_bit)
+
+        return board_zb_hash
+
+    def evaluate(self, prev_move: int) -> int:
+        # iterate through pieces and evaluate each
+        # the more in depth the evaluation, the better chance of pruning (probably)
+        eval = 0
+        board = self.board
+        piece_lst = self.piece_lst
+        attacks = self.attacks
+        occ = self.occ
+
+        # for each piece [# of captures I can make, # of moves to capture me], read off the attack maps
+        # if I am ever captured, I have to evaluate how meaning full that is for the game
+        # if I can capture, it doesn't matter if I'm going to get captured now
+        cap_counts = self._cap_counts
+        hit_counts = self._hit_counts
+        for i in range(24):
+            cap_counts[i] = 0
+            hit_counts[i] = 0
+        for pc in piece_lst:
+            targets = attacks[pc.id] & occ[not pc.color]
+            if not targets:
+                continue
+            # a white pawn capturing onto the top row is 4 moves, one per promotion
+            n = 4 if pc.zobrist_id == 1 and pc.r == 1 else 1
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                r, c = SQ_RC[low.bit_length() - 1]
+                cap_counts[pc.id] += n
+                hit_counts[board[r][c].id] += n
+
+        # enpassant isn't in the attack maps, it only exists right after the double push
+        if prev_move and prev_move & ENPASSANT:
+            ep_sq = (prev_move >> TO_SHIFT) & SQ_MASK
+            ep_r, ep_c = SQ_RC[ep_sq]
+            for (dc, from_mask) in ((1, BP_CAP_LEFT_FROM), (-1, BP_CAP_RIGHT_FROM)):
+                if 0 <= ep_c + dc < COLS and self.bb[0] & from_mask & (1 << (ep_sq + dc)):
+                    cap_counts[board[ep_r][ep_c + dc].id] += 1
+                    hit_counts[board[ep_r][ep_c].id] += 1
+
+        # evaluation also checks
+        capture_data = self._capture_data
+        for pc in piece_lst:
+            capture_data[0] = cap_counts[pc.id]
+            capture_data[1] = hit_counts[pc.id]
+            eval += pc.evaluate(board, capture_data)
+
+        return eval
+
+    def check_win(self) -> int:
+        # check if black piece on back rank
+        # check if all white pieces are captured
+        # check if all black pieces are captured
+
+        # captures first
+        if self.b_captured == 15:
+            return 1000
+        if self.w_captured == 9:
+            return -1000
+
+        for pc in self.board[7]: # for each pc in back rank check if black
+            if pc and not pc.color:
+                return -1000
+
+        return 0
+
+    def gen_player_moves(self, turn:bool, prev_move: int, caps: List[int], quiets: List[int]) -> Tuple[int, int]:
+        # fill the buffers with the active player's moves, returns (# of captures, # of quiet moves)
+        if turn:
+            return white_moves(self.bb, self.occ, prev_move, caps, quiets)
+        return black_moves(self.bb, self.occ, prev_move, caps, quiets)
+
+    def gen_captures(self, turn:bool, prev_move: int, caps: List[int]) -> int:
+        # just the captures (and black pawns stepping onto the back rank), for a staged search
+        if turn:
+            return white_captures(self.bb, self.occ, prev_move, caps)
+        return black_captures(self.bb, self.occ, prev_move, caps)
+
+    def gen_quiets(self, turn:bool, quiets: List[int]) -> int:
+        if turn:
+            return white_quiets(self.bb, self.occ, quiets)
+        return black_quiets(self.bb, self.occ, quiets)
+
+    def is_pseudo_legal(self, turn:bool, prev_move: int, mv: int) -> bool:
+        # can the side to move play mv here, for hash moves and killers that come from other positions
+        # only the moving piece's moves are generated (Piece.get_moves)
+        if not mv:
+            return False
+        rs, cs = SQ_RC[mv & SQ_MASK]
+        piece = self.board[rs][cs]
+        if piece is None or piece.color != turn:
+            return False
+        captures, moves = piece.get_moves(self.board, prev_move)
+        return mv in captures or mv in moves
+
+    def get_player_moves(self, turn:bool, prev_move: int) -> Tuple[List[int], List[int]]:
+        # same as gen_player_moves but returns new lists, for callers outside the search
+        caps = [0] * MAX_MOVES
+        quiets = [0] * MAX_MOVES
+        n_caps, n_quiets = self.gen_player_moves(turn, prev_move, caps, quiets)
+        return (caps[:n_caps], quiets[:n_quiets])
+
+    def get_all_moves(self, prev_move: int) -> Tuple[List[int], List[int]]:
+        # for every piece we have calc its moves!
+        b_mvs = self.get_player_moves(False, prev_move)
+        w_mvs = self.get_player_moves(True, prev_move)
+        return (b_mvs[0] + w_mvs[0], b_mvs[1] + w_mvs[1])
+
+    def print(self):
+        # loop through board and print piece or spaces
+        board_str = "  "
+        for row in self.board:
+            for pc in row:
+                if pc:
+                    board_str += f'{pc} '
+                else:
+                    board_str += '   '
+            board_str += '\n'
+        print(board_str)
+
+    def calculate_zb_hash(self, zb:np.typing.ArrayLike, turn:bool=True):
+        # get the full board hash, captured pieces aren't on the board so they don't count
+        # plus the side to move and the enpassant file (if the pawn can actually be taken)
+        zh_hash = 0
+        for pc in self.piece_lst:
+            if not pc.is_captured():
+                zh_hash = zh_hash ^ pc.zb_hash(zb) # XOR
+        if not turn:
+            zh_hash = zh_hash ^ zb[ZB_SIDE][0]
+        if self.ep_file >= 0:
+            zh_hash = zh_hash ^ zb[ZB_EP][self.ep_file]
+        self.hash = zh_hash
+        return zh_hash
+
+def update_board_zb_hash(board_zb_hash, zb:np.typing.ArrayLike, mv: int, piece: Piece, capture: Piece):
+    # update the hash, piece is the moved piece (already promoted if the move promotes)
+    # new = old ^ old_pos ^ new_pos (^ captured_pos)
+    frm = mv & SQ_MASK
+    to = (mv >> TO_SHIFT) & SQ_MASK
+
+    if mv & (PROMO_MASK << PROMO_SHIFT):
+        board_zb_hash = board_zb_hash ^ zb[1][frm] # starting condition was a pawn!
+    else:
+        board_zb_hash = board_zb_hash ^ zb[piece.zobrist_id][frm]
+
+    board_zb_hash = board_zb_hash ^ zb[piece.zobrist_id][to]
+
+    if capture:
+        if mv & ENPASSANT_CAP:
+            to = to - COLS # captured pawn is one row above the end square
+        board_zb_hash = board_zb_hash ^ zb[capture.zobrist_id][to]
+    return board_zb_hash
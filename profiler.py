@@ -0,0 +1,273 @@
+"""
+profiler.py
+Opt-in profiling of the search by phase, to see which part of the engine to speed up next
+
+Usage: python3 profiler.py [position] [-t SECONDS] [-d DEPTH] [-g MOVES] [-m] [-o out.collapsed]
+position: white's back rank like fill_board takes it ("knrb ") or a board string (board.board_to_str), default knrb
+-t/-d: limits of every search (default 2 seconds, depth 63)
+-g: play MOVES moves from the position (the engine against itself) and profile the whole game
+-m: also measure the memory every phase allocates (tracemalloc, the search runs several times slower)
+-o: also write the collapsed stacks (flamegraph.pl / speedscope), values are microseconds
+
+enable() swaps the engine functions below for timed wrappers in every module that imported them, disable() puts
+the originals back, so with the profiler off the search runs exactly as before. Phases:
+1. movegen, the bitboard generators by side and stage (white captures, white quiets, black captures, black quiets)
+   and Piece.get_moves by piece type (hash move/killer checks, the gui and perft -r use it)
+2. make_board_move, undo_board_move and update_board_zb_hash (inside make/undo)
+3. evaluate_board, evaluate_batch and check_win
+4. move ordering and transposition table probes/stores
+5. search, everything else (nega_max/quiesce themselves)
+
+Every phase gets its self time (time inside nested phases goes to the nested phase). With memory on it also gets
+the bytes its own code allocated, per call the high water mark above the memory in use when it was called (nested
+phases measured apart), so the temporaries freed before it returns count too. Memory handed out again in between
+only counts once, it is a lower bound on what was allocated and never negative.
+The wrappers cost a few microseconds a call, that is measured once (_calibrate) and taken out of the caller's
+self time, so the times are close to a run without the profiler but the small phases are the least exact.
+"""
+
+import time
+import tracemalloc
+import argparse
+from array import array
+import bitboard
+import board as B
+import position
+import search as S
+import ordering
+from piece import Piece
+from moves import move_str
+from zobrist_hashing import zobrist_load, TranspositionTable
+
+ROOT = 'search'
+
+# (function name, phase), the function is wrapped in every module below that has it
+PHASES = [
+    ('white_captures', 'movegen white captures'),
+    ('white_quiets', 'movegen white quiets'),
+    ('black_captures', 'movegen black captures'),
+    ('black_quiets', 'movegen black quiets'),
+    ('make_board_move', 'make_board_move'),
+    ('undo_board_move', 'undo_board_move'),
+    ('update_board_zb_hash', 'update_board_zb_hash'),
+    ('evaluate_board', 'evaluate_board'),
+    ('evaluate_batch', 'evaluate_batch'),
+    ('check_win', 'check_win'),
+    ('order_captures', 'ordering'),
+    ('order_quiets', 'ordering'),
+    ('tt_lookup', 'tt'),
+    ('tt_store', 'tt'),
+]
+MODULES = [bitboard, position, B, S, ordering]
+# Piece.get_moves phase by zobrist_id
+GET_MOVES_PHASES = ['get_moves black pawn', 'get_moves white pawn', 'get_moves king', 'get_moves knight', 'get_moves bishop', 'get_moves rook']
+
+# profile data, stack of phases (a tuple starting with ROOT) -> [calls, self seconds, self bytes allocated]
+records = {}
+_stack = [ROOT]
+# by depth in _stack, arrays so keeping count allocates nothing: time of the nested phases, and with memory on
+# the traced bytes the phase measures from, the traced bytes when it was called, its high water mark so far
+MAX_NESTING = 64
+_child_time = array('d', [0.0] * MAX_NESTING)
+_base = array('q', [0] * MAX_NESTING)
+_entered = array('q', [0] * MAX_NESTING)
+_high = array('q', [0] * MAX_NESTING)
+memory = False # set by profile(), tracemalloc runs
+_originals = [] # (module or class, name, original) to put back
+# seconds a wrapped call costs on top of the call (from _calibrate), inner is the part between the two
+# clock reads so it lands in the phase itself, the rest lands in the caller
+overhead = 0.0
+inner_overhead = 0.0
+
+def _level() -> int:
+    # start a new high water mark, returns where it starts, read twice so the tuple get_traced_memory returns
+    # is in it and the profiler's own objects don't count
+    tracemalloc.reset_peak()
+    tracemalloc.get_traced_memory()
+    return tracemalloc.get_traced_memory()[1]
+
+def _enter_memory(depth: int):
+    if depth:
+        # the caller's own high water mark up to the call
+        _high[depth - 1] = max(_high[depth - 1], tracemalloc.get_traced_memory()[1] - _base[depth - 1])
+    _base[depth] = _entered[depth] = _level()
+    _high[depth] = 0
+
+def _exit_memory(depth: int) -> int:
+    # bytes the phase allocated itself, the peak since the last reset only covers its own code
+    allocated = max(_high[depth], tracemalloc.get_traced_memory()[1] - _base[depth])
+    if depth:
+        # what the call kept is the call's, the caller measures on from here
+        _base[depth - 1] += _level() - _entered[depth]
+    return allocated
+
+def _call(phase: str, fn, args, kwargs):
+    depth = len(_stack)
+    _stack.append(phase)
+    _child_time[depth] = 0.0
+    start = time.perf_counter()
+    if memory:
+        _enter_memory(depth) # inside the clock reads, the floats they make aren't the phase's
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        allocated = _exit_memory(depth) if memory else 0
+        elapsed = time.perf_counter() - start
+        key = tuple(_stack)
+        _stack.pop()
+        rec = records.get(key)
+        if rec is None:
+            rec = records[key] = [0, 0.0, 0]
+        rec[0] += 1
+        rec[1] += elapsed - _child_time[depth] - inner_overhead
+        rec[2] += allocated
+        if depth:
+            # the wrapper's own cost would otherwise show up in the caller
+            _child_time[depth - 1] += elapsed + overhead - inner_overhead
+
+def _wrap(phase: str, fn):
+    def timed(*args, **kwargs):
+        return _call(phase, fn, args, kwargs)
+    timed.__wrapped__ = fn
+    return timed
+
+def _timed_get_moves(self, board, prev_move):
+    return _call(GET_MOVES_PHASES[self.zobrist_id], _piece_get_moves, (self, board, prev_move), {})
+
+_piece_get_moves = Piece.get_moves
+
+def enable():
+    # wrap the engine functions, calling it twice does nothing
+    if _originals:
+        return
+    for (name, phase) in PHASES:
+        wrapped = {} # one wrapper per function even if several modules imported it
+        for module in MODULES:
+            fn = getattr(module, name, None)
+            if fn is None:
+                continue
+            if fn not in wrapped:
+                wrapped[fn] = _wrap(phase, fn)
+            _originals.append((module, name, fn))
+            setattr(module, name, wrapped[fn])
+    _originals.append((Piece, 'get_moves', _piece_get_moves))
+    Piece.get_moves = _timed_get_moves
+
+def disable():
+    for (owner, name, fn) in reversed(_originals):
+        setattr(owner, name, fn)
+    _originals.clear()
+
+def reset():
+    records.clear()
+
+def _calibrate(n: int=2000, rounds: int=7):
+    # cost of the wrapper itself, timed on a function that does nothing, best of a few rounds
+    global overhead
+    global inner_overhead
+    def nothing():
+        pass
+    timed = _wrap('calibrate', nothing)
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(n):
+            nothing()
+        plain = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(n):
+            timed()
+        wrapped = time.perf_counter() - start
+        if best is None or wrapped - plain < best:
+            best = wrapped - plain
+    calls, seconds, _ = records.pop((ROOT, 'calibrate'))
+    overhead = max(best, 0.0) / n
+    inner_overhead = min(seconds / calls, overhead)
+
+def profile(fn, *args, track_memory: bool=False, **kwargs):
+    # run fn (a search) with the profiler on, the time not inside a phase goes to ROOT
+    # records add up over calls, reset() to start over, track_memory also measures the bytes allocated
+    global memory
+    if not overhead:
+        _calibrate()
+    enable()
+    _stack[:] = []
+    memory = track_memory
+    if memory:
+        tracemalloc.start()
+    try:
+        return _call(ROOT, fn, args, kwargs)
+    finally:
+        if memory:
+            tracemalloc.stop()
+        memory = False
+        _stack[:] = [ROOT]
+        disable()
+
+def phase_totals() -> dict:
+    # phase -> [calls, self seconds, self bytes allocated], over every stack the phase shows up in
+    totals = {}
+    for (key, (calls, seconds, allocated)) in records.items():
+        total = totals.setdefault(key[-1], [0, 0.0, 0])
+        total[0] += calls
+        total[1] += seconds
+        total[2] += allocated
+    return totals
+
+def print_report(track_memory: bool=False):
+    # track_memory adds the allocated KB columns (the records have to come from profile(..., track_memory=True))
+    totals = phase_totals()
+    total_time = sum(seconds for (_, seconds, _) in totals.values())
+    calls = sum(calls for (calls, _, _) in totals.values())
+    memory_head = f"{'alloc KB':>11}{'B/call':>9}" if track_memory else ''
+    print(f"{'phase':<26}{'calls':>10}{'self s':>9}{'%':>7}{'us/call':>11}{memory_head}")
+    for (phase, (n, seconds, allocated)) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        memory_cols = f"{allocated / 1024:>11.1f}{allocated / n:>9.0f}" if track_memory else ''
+        print(f"{phase:<26}{n:>10}{seconds:>9.3f}{seconds / max(total_time, 1e-9):>7.1%}{seconds / n * 1e6:>11.2f}{memory_cols}")
+    print(f"total {total_time:.3f}s without the profiler overhead (~{overhead * 1e6:.2f}us a call, {overhead * calls:.3f}s taken out)")
+    if track_memory:
+        print('times are with tracemalloc on, run without -m for the times')
+
+def write_collapsed(fname: str):
+    # one line per stack: "search;make_board_move;update_board_zb_hash 1234", self time in microseconds
+    with open(fname, 'w') as f:
+        for (key, (_, seconds, _)) in sorted(records.items()):
+            us = round(seconds * 1e6)
+            if us:
+                f.write(f"{';'.join(key)} {us}\n")
+
+def _setup(position: str) -> bool:
+    if '/' in position:
+        return B.load_board_str(position)
+    B.fill_board(white_back_rank=position)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='profile the search by phase')
+    parser.add_argument('position', nargs='?', default='knrb ')
+    parser.add_argument('-t', '--time', type=float, default=2.0, help='seconds per search')
+    parser.add_argument('-d', '--depth', type=int, default=S.MAX_PLY - 1)
+    parser.add_argument('-g', '--game', type=int, default=0, help='play this many moves')
+    parser.add_argument('-m', '--memory', action='store_true', help='measure the bytes every phase allocates')
+    parser.add_argument('-o', '--out', help='write collapsed stacks to this file')
+    args = parser.parse_args()
+
+    zb = zobrist_load()
+    tt = TranspositionTable()
+    turn = _setup(args.position)
+    board_zb_hash = B.calculate_zb_hash(zb, turn)
+    prev_move = None
+    for _ in range(max(args.game, 1)):
+        mv = profile(S.iterative_deepening, prev_move=prev_move, turn=turn, max_depth=args.depth, time_limit=args.time, zb=zb, board_zb_hash=board_zb_hash, tt=tt, track_memory=args.memory)
+        if mv is None:
+            break
+        print(f"{'white' if turn else 'black'} {move_str(mv)}, depth {S.completed_depth}, {S.stats.nodes} nodes")
+        board_zb_hash = B.make_board_move(mv=mv, zb=zb, board_zb_hash=board_zb_hash)
+        prev_move = mv
+        turn = not turn
+    print_report(track_memory=args.memory)
+    if args.out:
+        write_collapsed(args.out)
+
+if __name__ == "__main__":
+    main()
@@ -6,99 +6,514 @@
 # 2. Alpha a lower bound on the best value that the acting player can achieve
 # 3. Beta is an upper bound on what the opponent can achieve
 #
+# With a transposition table (tt) the zobrist hash of the position is carried through make/undo,
+# entries are probed on entry to a node and stored with the bound type of the result (see TT_Entry.flag)
+#
+# at depth 0 quiesce keeps searching captures/promotions (with stand pat) so leaves aren't scored mid exchange
+#
+# moves are searched hash move first, then captures by MVV-LVA, then killers and quiet moves by history (ordering.py)
+# each stage is generated only when the one before it didn't cut off, so cut nodes mostly never make their quiet moves
+#
+# at depth 1 the stand pat of the quiet children can be scored at once with numpy (batch_eval.py), quiesce then
+# skips its own evaluate_board, values are the same so the tree searched is the same
+#
+# iterative_deepening runs nega_max_root at depth 1, 2, 3... until a time or node limit runs out,
+# the search is aborted from inside the tree and the move of the last completed depth is played
+# the table's age goes up once a search (not once a depth), so the last depth's deeper entries aren't replaced first
+#
+# the search doesn't print, it counts into stats (stats.py) and hands results to reporter if one is set
+#
+# with an opening book (book.py) iterative_deepening plays the book move without searching when the book searched it
+# at least as deep as asked for, a shallower book move is only searched first
+#
+# with endgame tablebases (tablebase.py) loaded, nodes with few enough pieces left take the exact result from the
+# tables instead of being searched, and a root in the tables plays the fastest win (or the slowest loss) right away
+#
+# there is no repetition detection on purpose: black only has pawns and has to move every turn (no moves is
+# stalemate), and every black move takes a pawn one row forward, so no position can come back on a path or in a game
+# white shuffling its pieces between black moves only reaches the same position by another order of moves, that is
+# a transposition and the transposition table already answers it
+#
+# the search plays its moves on board.py's position, use_position (or iterative_deepening's position argument)
+# switches it to another game (position.Position), so one process can search many games one after the other
+
+import time
+from typing import List
+import board as B
+from board import evaluate_board, check_win, gen_player_moves, gen_captures, gen_quiets, is_pseudo_legal, make_board_move, undo_board_move, bb, occ
+from moves import MAX_MOVES, SQ_MASK, TO_SHIFT, PROMO_SHIFT, PROMO_MASK, CAPTURE, ENPASSANT
+from zobrist_hashing import tt_lookup, tt_store, tt_new_search
+from ordering import order_captures, order_quiets, update_quiet_cutoff, new_search, killers, NUM_KILLERS
+from batch_eval import encode_board, encode_children, evaluate_batch
+from stats import SearchStats
+# book.py and tablebase.py are imported where they are probed, importing the search (engine.py) doesn't load them
+# (or the multiprocessing their generators use) unless a book or tables are set
 
-from board import evaluate_board, check_win, get_player_moves, make_board_move, undo_board_move, print_board
-from moves import Move
+MAX_PLY = 64
 
-def nega_max_root(prev_move: Move, d:int, alpha: int, beta:int, turn:bool, zb=None, board_zb_hash=None) -> Move:
+# tt flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# one capture and one quiet move buffer per ply, filled in place by gen_player_moves
+cap_bufs = [[0] * MAX_MOVES for _ in range(MAX_PLY)]
+quiet_bufs = [[0] * MAX_MOVES for _ in range(MAX_PLY)]
+# the hash move and the killers are searched as their own stages before the rest
+hash_bufs = [[0] for _ in range(MAX_PLY)]
+killer_bufs = [[0] * NUM_KILLERS for _ in range(MAX_PLY)] # slots 0 and 1, NUM_KILLERS is fixed at two
+BACK_RANK = 35 # first square of the bottom row
+
+# quiescence search limits, the node limit is per horizon node so one wild exchange can't eat the whole search
+QS_MAX_DEPTH = 8
+QS_NODE_LIMIT = 256
+qs_nodes_left = 0
+
+# batched evaluation of the quiet children at depth 1, numpy only pays off once there are enough of them
+# off by default, with the incremental attack maps evaluate_board is ~15us a child and a batch costs about the same
+# per child, plus the batch also scores children a cutoff would have skipped
+BATCH_EVAL = False
+BATCH_MIN = 16
+
+# search limits, stats.nodes is counted by nega_max and quiesce
+CHECK_EVERY = 1024 # nodes between limit checks, must be a power of two
+max_nodes = 0 # 0 = no limit
+deadline = 0.0 # time.perf_counter() value to stop at, 0 = no limit
+stop = None # shared multiprocessing.Value, lazy smp helpers stop when it is set (parallel.py)
+
+book = None # opening book (book.book_load), checked by iterative_deepening before it searches
+tablebases = None # endgame tablebases (tablebase.tb_load), probed at every node with at most tb_max pieces
+tb_max = 0 # tablebase.tb_pieces(tablebases)
+
+stats = SearchStats() # reset by iterative_deepening
+reporter = None # called with an event dict, see stats.py (stats.print_reporter prints them)
+
+# best move/score found so far by nega_max_root, still valid if the search gets aborted
+root_best_move = None
+root_score = 0
+# deepest iteration iterative_deepening finished and its score
+completed_depth = 0
+completed_score = 0
+# nega_max_root took its move from the tablebases, the score is exact and a deeper search can't change it
+tb_root = False
+
+def use_position(pos):
+    # search pos (a position.Position) from now on, board.use_position plus the names imported here
+    # returns the position that was searched before
+    global evaluate_board, check_win, gen_player_moves, gen_captures, gen_quiets, is_pseudo_legal, make_board_move, undo_board_move, bb, occ
+    old = B.use_position(pos)
+    evaluate_board = B.evaluate_board
+    check_win = B.check_win
+    gen_player_moves = B.gen_player_moves
+    gen_captures = B.gen_captures
+    gen_quiets = B.gen_quiets
+    is_pseudo_legal = B.is_pseudo_legal
+    make_board_move = B.make_board_move
+    undo_board_move = B.undo_board_move
+    bb = B.bb
+    occ = B.occ
+    return old
+
+def _tb_score(prev_move: int, turn: bool) -> int:
+    # the tablebase score of the position for the side to move, or None if it isn't in the tables
+    # positions where black can take enpassant aren't stored, they are searched
+    if (occ[0] | occ[1]).bit_count() > tb_max or (prev_move and prev_move & ENPASSANT):
+        return None
+    from tablebase import tb_probe, tb_score
+    v = tb_probe(tablebases, bb, turn)
+    if v is None:
+        return None
+    stats.tb_hits += 1
+    return tb_score(v)
+
+class SearchAbort(Exception):
+    # raised inside the tree when a limit runs out, every make has an undo in a finally so the board is restored
+    pass
+
+def _check_limits():
+    if max_nodes and stats.nodes >= max_nodes:
+        raise SearchAbort()
+    if deadline and time.perf_counter() >= deadline:
+        raise SearchAbort()
+    if stop is not None and stop.value:
+        raise SearchAbort()
+
+def _has_move(buf, n:int, mv:int) -> bool:
+    # only trust the hash move if it was generated in this position
+    for i in range(n):
+        if buf[i] == mv:
+            return True
+    return False
+
+def root_moves(prev_move: int, turn:bool, board_zb_hash=None, tt=None, first_move:int=None) -> List[int]:
+    # the root moves in the order they are searched:
+    # first_move (or the hash move), then captures by MVV-LVA, then quiet moves
+    caps = cap_bufs[0]
+    quiets = quiet_bufs[0]
+    n_caps, n_quiets = gen_player_moves(turn, prev_move, caps, quiets)
+    hash_mv = 0
+    if tt is not None and board_zb_hash is not None:
+        entry = tt_lookup(tt, int(board_zb_hash))
+        if entry and (_has_move(caps, n_caps, entry.best_move) or _has_move(quiets, n_quiets, entry.best_move)):
+            hash_mv = entry.best_move
+    if first_move and (_has_move(caps, n_caps, first_move) or _has_move(quiets, n_quiets, first_move)):
+        hash_mv = first_move
+    order_captures(caps, n_caps)
+    order_quiets(quiets, n_quiets, 0)
+    mvs = [hash_mv] if hash_mv else []
+    mvs += [mv for mv in caps[:n_caps] if mv != hash_mv]
+    mvs += [mv for mv in quiets[:n_quiets] if mv != hash_mv]
+    return mvs
+
+def nega_max_root(prev_move: int, d:int, alpha: int, beta:int, turn:bool, zb=None, board_zb_hash=None, tt=None, first_move:int=None) -> int:
     # root iteration set up val_flip
     # return move with best score
+    # first_move (the best move of the previous iteration) is searched first if given
+    global root_best_move
+    global root_score
+    global tb_root
+    root_best_move = None
+    tb_root = False
     win = check_win()
     if win:
         return None
     if d == 0:
         return None
-    
+
+    if tablebases is not None and (occ[0] | occ[1]).bit_count() <= tb_max:
+        from tablebase import tb_best_move, tb_score
+        best = tb_best_move(tablebases, turn, prev_move)
+        if best is not None:
+            root_best_move = best[0]
+            root_score = tb_score(best[1])
+            tb_root = True
+            if reporter is not None:
+                reporter({'event': 'root', 'depth': d, 'score': root_score, 'move': root_best_move, 'tb': True})
+            return root_best_move
+
     # get moves and check stalemate
-    mvs = get_player_moves(turn=turn, prev_move=prev_move)
-    if not mvs[0] and not mvs[1]: # if both are empty aka stalemate
+    mvs = root_moves(prev_move=prev_move, turn=turn, board_zb_hash=board_zb_hash, tt=tt, first_move=first_move)
+    if not mvs: # no moves aka stalemate
         return None
-    
+
+    use_tt = tt is not None and zb is not None
+    if use_tt:
+        key = int(board_zb_hash)
+
     val_flip = 1 if turn else -1
+    alpha_orig = alpha
     score = -1001
     mv = None
-    for cap_mv in mvs[0]:
-        make_board_move(mv=cap_mv)
-        val = -1 * nega_max(prev_move=cap_mv, d=d-1, alpha=-1*beta, beta=-1*alpha, val_flip=val_flip*-1, turn=not turn)
+    for root_mv in mvs:
+        child_hash = make_board_move(mv=root_mv, zb=zb, board_zb_hash=board_zb_hash)
+        try:
+            val = -1 * nega_max(prev_move=root_mv, d=d-1, alpha=-1*beta, beta=-1*alpha, val_flip=val_flip*-1, turn=not turn, zb=zb, board_zb_hash=child_hash, ply=1, tt=tt)
+        finally:
+            undo_board_move(mv=root_mv)
         # print(val)
         if val > score:
             score = val
-            mv = cap_mv
+            mv = root_mv
+            root_best_move, root_score = mv, score
             if score > alpha:
                 alpha = score
             if score >= beta:
-                undo_board_move(mv=cap_mv)
-                print(score)
-                return mv
-        undo_board_move(mv=cap_mv)
-    for movement_mv in mvs[1]:
-        # do the thing again
-        make_board_move(mv=movement_mv)
-        val = -1 * nega_max(prev_move=movement_mv, d=d-1, alpha=-1*beta, beta=-1*alpha, val_flip=val_flip*-1, turn=not turn)
-        if val > score:
-            score = val
-            mv = movement_mv
-            if score > alpha:
-                alpha = score
-            if score >= beta:
-                undo_board_move(mv=movement_mv)
-                print(score)
-                return mv
-        undo_board_move(mv=movement_mv)
-    print(score)
+                if use_tt:
+                    tt_store(tt, key, score, d, LOWER, mv)
+                break
+    else:
+        if use_tt:
+            tt_store(tt, key, score, d, EXACT if score > alpha_orig else UPPER, mv)
+    if reporter is not None:
+        reporter({'event': 'root', 'depth': d, 'score': score, 'move': mv})
     return mv
 
-def nega_max(prev_move:Move, d: int, alpha: int, beta:int, turn:bool, val_flip:int, zb=None, board_zb_hash=None) -> int:
+def nega_max(prev_move: int, d: int, alpha: int, beta:int, turn:bool, val_flip:int, zb=None, board_zb_hash=None, ply:int=1, tt=None) -> int:
+    # at the horizon keep going through the captures instead of evaluating mid exchange
+    if d == 0:
+        return quiesce(prev_move=prev_move, alpha=alpha, beta=beta, turn=turn, val_flip=val_flip, ply=ply, qdepth=0)
+
+    st = stats
+    st.nodes += 1
+    if not st.nodes & (CHECK_EVERY - 1):
+        _check_limits()
+
     # check if draw by getting moves, but check depth/win before anything
     win = check_win()
     if win:
-        print_board()
         return win * val_flip
-    if d == 0:
-        return evaluate_board(prev_move=prev_move) * val_flip
-    # get moves and check for stalemate
-    mvs = get_player_moves(turn=turn, prev_move=prev_move)
-    if not mvs[0] and not mvs[1]: # if both are empty aka stalemate
-        return 0
-    
+    if tablebases is not None:
+        tb = _tb_score(prev_move, turn)
+        if tb is not None:
+            return tb
+
+    # probe the table, a deep enough entry can answer the node or tighten the window
+    use_tt = tt is not None and zb is not None
+    alpha_orig = alpha
+    hash_mv = 0
+    if use_tt:
+        key = int(board_zb_hash)
+        entry = tt_lookup(tt, key)
+        st.tt_probes += 1
+        if entry:
+            st.tt_hits += 1
+            if entry.depth >= d:
+                if entry.flag == EXACT:
+                    return entry.value
+                if entry.flag == LOWER and entry.value > alpha:
+                    alpha = entry.value
+                elif entry.flag == UPPER and entry.value < beta:
+                    beta = entry.value
+                if alpha >= beta:
+                    return entry.value
+            hash_mv = entry.best_move
+
+    # moves are generated one stage at a time, a cutoff in an early stage never generates the later ones
+    # the hash move and killers come from other positions so they are checked before being played
+    if hash_mv and not is_pseudo_legal(turn, prev_move, hash_mv):
+        hash_mv = 0
+    hash_buf = hash_bufs[ply]
+    hash_buf[0] = hash_mv
+    caps = cap_bufs[ply]
+    quiets = quiet_bufs[ply]
+    killer_buf = killer_bufs[ply]
+    killer_buf[0] = killer_buf[1] = 0
+
+    stand_pats = None
+    searched = 0
     score = -1000
-    for cap_mv in mvs[0]:
-        # do the thing
-        make_board_move(mv=cap_mv)
-        val = -1 * nega_max(prev_move=cap_mv, d=d-1, alpha=-1*beta, beta=-1*alpha, val_flip=val_flip*-1, turn=not turn)
-        if val > score:
-            score = val
-            if score > alpha:
-                alpha = score
-            if score >= beta:
-                # print('PRUNE')
-                undo_board_move(mv=cap_mv)
-                return score
-        undo_board_move(mv=cap_mv)
-
-    for movement_mv in mvs[1]:
-        # do the thing again
-        make_board_move(mv=movement_mv)
-        val = -1 * nega_max(prev_move=movement_mv, d=d-1, alpha=-1*beta, beta=-1*alpha, val_flip=val_flip*-1, turn=not turn)
-        if val > score:
-            # print(val)
-            score = val
-            if score > alpha:
-                alpha = score
-            if score >= beta:
-                # print('PRUNE')
-                undo_board_move(mv=movement_mv)
-                return score
-        undo_board_move(mv=movement_mv)
+    best_mv = 0
+    # hash move first, then captures, then killers, then the rest of the quiet moves
+    for stage in range(4):
+        if stage == 0:
+            buf, n = hash_buf, 1 if hash_mv else 0
+        elif stage == 1:
+            n = gen_captures(turn, prev_move, caps)
+            order_captures(caps, n)
+            buf = caps
+        elif stage == 2:
+            buf, n = killer_buf, _fill_killers(killer_buf, ply, turn, prev_move, hash_mv)
+        else:
+            n = gen_quiets(turn, quiets)
+            order_quiets(quiets, n, ply)
+            buf = quiets
+            # no cutoff so far so most of the quiet moves will be searched,
+            # the children are leaves, score all of their stand pats in one go
+            if d == 1 and BATCH_EVAL and n >= BATCH_MIN:
+                stand_pats = _batch_stand_pats(quiets, n, -val_flip)
+        for i in range(n):
+            # do the thing
+            mv = buf[i]
+            if buf is not hash_buf and mv == hash_mv:
+                continue
+            if buf is quiets and (mv == killer_buf[0] or mv == killer_buf[1]):
+                continue
+            searched += 1
+            child_hash = make_board_move(mv=mv, zb=zb, board_zb_hash=board_zb_hash)
+            try:
+                if stand_pats is not None:
+                    val = -1 * quiesce(prev_move=mv, alpha=-1*beta, beta=-1*alpha, turn=not turn, val_flip=val_flip*-1, ply=ply+1, qdepth=0, stand_pat=stand_pats.get(mv))
+                else:
+                    val = -1 * nega_max(prev_move=mv, d=d-1, alpha=-1*beta, beta=-1*alpha, val_flip=val_flip*-1, turn=not turn, zb=zb, board_zb_hash=child_hash, ply=ply+1, tt=tt)
+            finally:
+                undo_board_move(mv=mv)
+            if val > score:
+                score = val
+                best_mv = mv
+                if score > alpha:
+                    alpha = score
+                if score >= beta:
+                    st.cutoffs += 1
+                    if searched == 1:
+                        st.first_cutoffs += 1
+                    if buf is not caps and _is_quiet(mv, turn):
+                        update_quiet_cutoff(mv, ply, d)
+                    if use_tt:
+                        tt_store(tt, key, score, d, LOWER, best_mv)
+                    return score
+
+    if not searched: # no moves aka stalemate
+        return 0
+
+    if use_tt:
+        tt_store(tt, key, score, d, EXACT if score > alpha_orig else UPPER, best_mv)
+    return score
+
+def _is_quiet(mv: int, turn: bool) -> bool:
+    # not a capture and not a black pawn stepping onto the back rank (those go with the captures)
+    return not mv & CAPTURE and (turn or (mv >> TO_SHIFT) & SQ_MASK < BACK_RANK)
+
+def _fill_killers(killer_buf, ply: int, turn: bool, prev_move: int, hash_mv: int) -> int:
+    # the killers of this ply that can be played here and weren't already searched as the hash move
+    n = 0
+    for mv in killers[ply]:
+        if mv and mv != hash_mv and _is_quiet(mv, turn) and is_pseudo_legal(turn, prev_move, mv):
+            killer_buf[n] = mv
+            n += 1
+    return n
+
+def _batch_stand_pats(buf, n: int, child_flip: int) -> dict:
+    # {move: stand pat of the child} for buf[0:n], from the child's point of view
+    # a double push leaves an enpassant capture that evaluate_batch doesn't see, quiesce evaluates those itself
+    mvs = [mv for mv in buf[:n] if not mv & ENPASSANT]
+    if not mvs:
+        return {}
+    stats.evals += len(mvs)
+    vals = evaluate_batch(encode_children(encode_board(bb), mvs))
+    return {mv: int(val) * child_flip for (mv, val) in zip(mvs, vals)}
+
+def _is_promotion(mv: int) -> bool:
+    return bool(mv & (PROMO_MASK << PROMO_SHIFT))
+
+def quiesce(prev_move: int, alpha: int, beta: int, turn: bool, val_flip: int, ply: int, qdepth: int, stand_pat: int=None) -> int:
+    # search only captures, black pawns stepping onto the back rank and white promotions
+    # the side to move can always "stand pat" and take the static evaluation instead
+    # stand_pat can be passed in if it was already scored (batch evaluation at depth 1)
+    global qs_nodes_left
+    st = stats
+    st.nodes += 1
+    st.qnodes += 1
+    if not st.nodes & (CHECK_EVERY - 1):
+        _check_limits()
+    if qdepth == 0:
+        qs_nodes_left = QS_NODE_LIMIT
+    qs_nodes_left -= 1
+
+    win = check_win()
+    if win:
+        return win * val_flip
+    if tablebases is not None:
+        tb = _tb_score(prev_move, turn)
+        if tb is not None:
+            return tb
+
+    if stand_pat is None:
+        st.evals += 1
+        stand_pat = evaluate_board(prev_move=prev_move) * val_flip
+    if stand_pat >= beta:
+        return stand_pat
+    if qdepth >= QS_MAX_DEPTH or qs_nodes_left <= 0 or ply >= MAX_PLY - 1:
+        return stand_pat
+    if stand_pat > alpha:
+        alpha = stand_pat
+
+    caps = cap_bufs[ply]
+    quiets = quiet_bufs[ply]
+    n_caps, n_quiets = gen_player_moves(turn, prev_move, caps, quiets)
+    if not n_caps and not n_quiets: # stalemate
+        return 0
+
+    score = stand_pat
+    order_captures(caps, n_caps)
+    for (buf, n) in ((caps, n_caps), (quiets, n_quiets if turn else 0)):
+        for i in range(n):
+            mv = buf[i]
+            if buf is quiets and not _is_promotion(mv):
+                continue
+            make_board_move(mv=mv)
+            try:
+                val = -1 * quiesce(prev_move=mv, alpha=-1*beta, beta=-1*alpha, turn=not turn, val_flip=val_flip*-1, ply=ply+1, qdepth=qdepth+1)
+            finally:
+                undo_board_move(mv=mv)
+            if val > score:
+                score = val
+                if score > alpha:
+                    alpha = score
+                if score >= beta:
+                    return score
+    return score
+
+def iterative_deepening(prev_move: int, turn:bool, max_depth:int=MAX_PLY-1, time_limit:float=None, node_limit:int=None, zb=None, board_zb_hash=None, tt=None, pool=None, start_depth:int=1, position=None, tt_age:int=None) -> int:
+    # search depth start_depth, start_depth + 1, ... max_depth, stop when time_limit (seconds) or node_limit runs out
+    # returns the best move of the deepest completed iteration
+    # with a pool (parallel.make_pool) the root moves are split over worker processes, the node limit is only
+    # checked in this process then
+    # position: search this position.Position instead of the current one, the current one is put back after
+    # tt_age: store with this age instead of starting a new one (lazy smp, every process is in the same search)
+    global max_nodes
+    global deadline
+    global completed_depth
+    global completed_score
+    global root_best_move
+    global root_score
+
+    if position is not None and position is not B.position:
+        old = use_position(position)
+        try:
+            return iterative_deepening(prev_move=prev_move, turn=turn, max_depth=max_depth, time_limit=time_limit, node_limit=node_limit, zb=zb, board_zb_hash=board_zb_hash, tt=tt, pool=pool, start_depth=start_depth, tt_age=tt_age)
+        finally:
+            use_position(old)
+
+    completed_depth = 0
+    if check_win():
+        return None
+
+    if pool is not None:
+        from parallel import nega_max_root_parallel # parallel imports this module
+
+    start = time.perf_counter()
+    new_search()
+    stats.reset()
+    max_nodes = node_limit or 0
+    deadline = start + time_limit if time_limit else 0.0
+
+    best_mv = None
+    if book is not None and board_zb_hash is not None:
+        from book import book_probe
+        entry = book_probe(book, board_zb_hash)
+        # the move has to be playable here, a key collision must not play nonsense
+        if entry and is_pseudo_legal(turn, prev_move, entry.best_move):
+            if entry.depth >= min(max_depth, MAX_PLY - 1):
+                # searched at least as deep as we were asked to
+                root_best_move, root_score = entry.best_move, entry.value
+                completed_depth, completed_score = entry.depth, entry.value
+                if reporter is not None:
+                    reporter({'event': 'root', 'depth': entry.depth, 'score': entry.value, 'move': entry.best_move, 'book': True})
+                return entry.best_move
+            best_mv = entry.best_move # too shallow, search it first
+
+    if tt is not None:
+        if tt_age is None:
+            tt_new_search(tt)
+        else:
+            tt.age = tt_age
+
+    try:
+        for d in range(start_depth, min(max_depth, MAX_PLY - 1) + 1):
+            try:
+                if pool is not None:
+                    mv = nega_max_root_parallel(prev_move=prev_move, d=d, alpha=-1000, beta=1000, turn=turn, pool=pool, zb=zb, board_zb_hash=board_zb_hash, tt=tt, first_move=best_mv)
+                else:
+                    mv = nega_max_root(prev_move=prev_move, d=d, alpha=-1000, beta=1000, turn=turn, zb=zb, board_zb_hash=board_zb_hash, tt=tt, first_move=best_mv)
+            except SearchAbort:
+                # half finished iteration, only use it if we don't have anything yet
+                if best_mv is None:
+                    best_mv = root_best_move
+                break
+            if mv is None: # game over or no moves
+                break
+            best_mv = mv
+            completed_depth, completed_score = d, root_score
+            if tb_root: # exact, searching deeper would only find the same result
+                break
+            stats.end_depth(depth=d, score=root_score, move=mv)
+            if reporter is not None:
+                reporter({'event': 'iteration', 'depth': d, 'score': root_score, 'move': mv, 'stats': stats})
+            # a won/lost root can't get any better
+            if abs(root_score) >= 1000:
+                break
+            # the next depth takes a lot longer than this one did, don't start what we can't finish
+            if time_limit and time.perf_counter() - start > time_limit / 2:
+                break
+    finally:
+        max_nodes = 0
+        deadline = 0.0
 
-    return score
\ No newline at end of file
+    if best_mv is None:
+        # aborted before any move was searched, play the first legal one
+        caps = cap_bufs[0]
+        quiets = quiet_bufs[0]
+        n_caps, n_quiets = gen_player_moves(turn, prev_move, caps, quiets)
+        if n_caps:
+            best_mv = caps[0]
+        elif n_quiets:
+            best_mv = quiets[0]
+    return best_mv
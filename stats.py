@@ -0,0 +1,82 @@
+"""
+stats.py
+Search statistics and reporting
+
+SearchStats is a handful of int counters the search bumps as it goes (search.stats), cheap enough to always be on:
+1. nodes, every nega_max and quiesce node (the time/node limits use this count)
+2. qnodes, the quiesce part of nodes
+3. evals, static evaluations (evaluate_board or batch_eval)
+4. cutoffs and first_cutoffs, beta cutoffs in nega_max and how many of them came from the first move searched
+5. tt_probes and tt_hits, transposition table lookups in nega_max and how many found the position
+6. tb_hits, nodes answered by the endgame tablebases (tablebase.py)
+
+end_depth() closes an iteration of iterative deepening and keeps what that iteration cost in depths.
+
+Nothing is printed by the search, it hands events to search.reporter if one is set:
+reporter(event: dict), event['event'] is 'root' (a nega_max_root finished, or event['book'] is set if the move
+came from the opening book, event['tb'] if it came from the endgame tablebases) or 'iteration' (iterative deepening
+finished a depth). print_reporter writes them as one line each.
+"""
+
+import time
+
+COUNTERS = ('nodes', 'qnodes', 'evals', 'cutoffs', 'first_cutoffs', 'tt_probes', 'tt_hits', 'tb_hits')
+
+class SearchStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.evals = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tb_hits = 0
+        self.depths = [] # one dict per finished iteration, the counters are for that iteration only
+        self.start = time.perf_counter()
+        self._mark = (0,) * len(COUNTERS)
+        self._mark_time = self.start
+
+    def counters(self) -> dict:
+        return {name: getattr(self, name) for name in COUNTERS}
+
+    def add(self, counters: dict):
+        # fold in counters from another search (a worker process)
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + counters.get(name, 0))
+
+    def end_depth(self, depth: int, score: int, move: int) -> dict:
+        now = time.perf_counter()
+        current = tuple(getattr(self, name) for name in COUNTERS)
+        entry = {name: current[i] - self._mark[i] for (i, name) in enumerate(COUNTERS)}
+        entry.update(depth=depth, score=score, move=move, time=now - self._mark_time)
+        self.depths.append(entry)
+        self._mark = current
+        self._mark_time = now
+        return entry
+
+    def first_cutoff_rate(self) -> float:
+        # how often the first move was good enough, the higher the better the move ordering
+        return self.first_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def nps(self) -> float:
+        return self.nodes / max(time.perf_counter() - self.start, 1e-9)
+
+def print_reporter(event: dict):
+    # one line per event, for the console or a log file
+    if event['event'] == 'root':
+        print(f"depth {event['depth']} score {event['score']}" + (' (book)' if event.get('book') else ' (tablebase)' if event.get('tb') else ''))
+    elif event['event'] == 'iteration':
+        stats = event['stats']
+        d = stats.depths[-1]
+        first_rate = d['first_cutoffs'] / d['cutoffs'] if d['cutoffs'] else 0.0
+        tt_rate = d['tt_hits'] / d['tt_probes'] if d['tt_probes'] else 0.0
+        print(f"depth {d['depth']} score {d['score']} nodes {d['nodes']} qnodes {d['qnodes']} evals {d['evals']} "
+              f"cutoffs {d['cutoffs']} first {first_rate:.0%} tt hits {tt_rate:.0%} time {d['time']:.2f}s "
+              f"total nodes {stats.nodes} nps {stats.nps():.0f}")
@@ -0,0 +1,344 @@
+"""
+tablebase.py
+Endgame tablebases, every position with a few pieces left solved exactly (win/loss/draw and how many plies to the end)
+
+Usage: python3 tablebase.py [-n PIECES] [-w WHITE] [-j WORKERS] [-d DIR]
+       python3 tablebase.py -s "position string" [-d DIR]
+-n: most pieces on the board (both colors, default 4), -w: most white pieces (default 2)
+-j: worker processes, one per core by default
+-s: look up a position (board.board_to_str format)
+
+A table covers one material signature, the count of each piece type (black pawns, white pawns, kings, knights,
+bishops, rooks), named like "KNvpp" (white pieces v black pawns). It is one byte per position:
+0 = draw, 1-126 = the side to move wins in that many plies, 128 + n = the side to move loses in n plies,
+255 = not a position (two pieces on one square). Positions where black can take enpassant aren't in the tables.
+
+Index: the squares of each piece type are ranked as a combination (pieces of a type are the same),
+black pawns can be on rows 0-6 (row 7 is a win), white pawns on rows 1-6, the rest anywhere,
+then the side to move. A file is a header (TB_HEADER_SIZE bytes) and the bytes, opened with np.memmap.
+
+Solving: black only has pawns and every black move takes one forward, so the game can't go in circles. A position
+is solved from its children (make/undo with the engine's own move generation, so every rule quirk is in) and the
+values are kept as they are found, so each position is worked out once. Captures and promotions lead to other
+signatures, those are generated first (fewer pieces first, then fewer white pawns).
+"""
+
+import os
+import sys
+import time
+import struct
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import board as B
+from position import PIECE_CHARS, ROWS, COLS
+
+TB_DIR = 'tb'
+TB_MAGIC = b'NEGAMXTB'
+TB_HEADER = '<8sI6BxxQ' # magic, version, piece counts by zobrist_id, # of positions
+TB_HEADER_SIZE = 64
+TB_VERSION = 1
+TB_PIECES = 4
+TB_WHITE = 2
+
+DRAW = 0
+LOSS = 128 # + plies
+INVALID = 255
+UNKNOWN = 127 # only while generating
+
+# squares a piece type can stand on, (first square, # of squares) by zobrist_id
+DOMAINS = [(0, (ROWS - 1) * COLS), (COLS, (ROWS - 2) * COLS), (0, ROWS * COLS), (0, ROWS * COLS), (0, ROWS * COLS), (0, ROWS * COLS)]
+BINOMIAL = [[0] * 8 for _ in range(ROWS * COLS + 1)] # BINOMIAL[n][k], k up to 7 pieces of a type
+for n in range(ROWS * COLS + 1):
+    BINOMIAL[n][0] = 1
+    for k in range(1, 8):
+        BINOMIAL[n][k] = BINOMIAL[n - 1][k - 1] + BINOMIAL[n - 1][k] if n else 0
+
+def tb_name(counts) -> str:
+    return ''.join(PIECE_CHARS[t] * counts[t] for t in range(1, 6)) + 'v' + 'p' * counts[0]
+
+def tb_size(counts) -> int:
+    n = 2
+    for t in range(6):
+        n *= BINOMIAL[DOMAINS[t][1]][counts[t]]
+    return n
+
+def tb_index(bb, turn:bool, counts) -> int:
+    # index of the position from the bitboards, the squares of a type are lowest first like a combination
+    idx = 0
+    for t in range(6):
+        k = counts[t]
+        if not k:
+            continue
+        lo, size = DOMAINS[t]
+        rank = 0
+        i = 1
+        b = bb[t]
+        while b:
+            low = b & -b
+            b ^= low
+            rank += BINOMIAL[low.bit_length() - 1 - lo][i]
+            i += 1
+        idx = idx * BINOMIAL[size][k] + rank
+    return idx * 2 + (0 if turn else 1)
+
+def tb_squares(idx:int, counts):
+    # the other way around: (side to move, [squares by zobrist_id])
+    turn = idx % 2 == 0
+    idx //= 2
+    squares = [[] for _ in range(6)]
+    for t in reversed(range(6)):
+        k = counts[t]
+        if not k:
+            continue
+        lo, size = DOMAINS[t]
+        idx, rank = divmod(idx, BINOMIAL[size][k])
+        s = size
+        for i in range(k, 0, -1):
+            s -= 1
+            while BINOMIAL[s][i] > rank:
+                s -= 1
+            rank -= BINOMIAL[s][i]
+            squares[t].append(s + lo)
+    return (turn, squares)
+
+def tb_score(v:int) -> int:
+    # search score for the side to move, wins and losses are the same as check_win's
+    if v == DRAW:
+        return 0
+    return 1000 if v < LOSS else -1000
+
+def _counts(bb):
+    return tuple(b.bit_count() for b in bb)
+
+def tb_probe(tables:dict, bb, turn:bool) -> int:
+    # the table byte of the current position or None, the caller makes sure black can't take enpassant
+    counts = _counts(bb)
+    table = tables.get(counts)
+    if table is None:
+        return None
+    v = int(table[tb_index(bb, turn, counts)])
+    return None if v == INVALID else v
+
+def _tb_value(tables:dict, turn:bool, prev_move:int) -> int:
+    # tb_probe, but black to move with an enpassant capture is worked out from its moves
+    if B.ep_file < 0:
+        return tb_probe(tables, B.bb, turn)
+    values = []
+    caps, quiets = B.get_player_moves(turn, prev_move)
+    for mv in caps + quiets:
+        B.make_board_move(mv=mv)
+        try:
+            if B.check_win():
+                values.append(1)
+            else:
+                child = tb_probe(tables, B.bb, not turn)
+                if child is None:
+                    return None
+                values.append(_parent_value(child))
+        finally:
+            B.undo_board_move(mv=mv)
+    return _best_value(values)
+
+def tb_best_move(tables:dict, turn:bool, prev_move:int):
+    # (move, table byte) of the best move here: the fastest win, else a draw, else the slowest loss
+    # None if the position or one of its children isn't in the tables
+    if _tb_value(tables, turn, prev_move) is None:
+        return None
+    caps, quiets = B.get_player_moves(turn, prev_move)
+    best = None
+    best_key = None
+    for mv in caps + quiets:
+        B.make_board_move(mv=mv)
+        try:
+            if B.check_win():
+                v = 1 # wins right away
+            else:
+                child = _tb_value(tables, not turn, mv)
+                if child is None:
+                    return None
+                v = _parent_value(child)
+        finally:
+            B.undo_board_move(mv=mv)
+        # wins by distance, then draws, then losses by the longest
+        key = (0, v) if 0 < v < LOSS else (1, 0) if v == DRAW else (2, -(v - LOSS))
+        if best_key is None or key < best_key:
+            best, best_key = (mv, v), key
+    return best
+
+def _best_value(values) -> int:
+    # the shortest win, else a draw, else the longest loss, no moves is a draw
+    win = 0
+    draw = False
+    loss = -1
+    for v in values:
+        if 0 < v < LOSS:
+            if not win or v < win:
+                win = v
+        elif v == DRAW:
+            draw = True
+        elif v > loss:
+            loss = v
+    if win:
+        return win
+    if draw or loss < 0:
+        return DRAW
+    return loss
+
+def _parent_value(child:int) -> int:
+    # value for the player who moved into a position worth child to the side to move there
+    if child == DRAW:
+        return DRAW
+    if child >= LOSS:
+        return child - LOSS + 1 # they lose, we win one ply later
+    return LOSS + child + 1
+
+def tb_load(directory=TB_DIR) -> dict:
+    # every table in the directory, counts -> np.memmap of the bytes
+    tables = {}
+    if not os.path.isdir(directory):
+        return tables
+    for fname in os.listdir(directory):
+        if not fname.endswith('.tb'):
+            continue
+        path = os.path.join(directory, fname)
+        with open(path, 'rb') as f:
+            magic, version, *counts, n = struct.unpack(TB_HEADER, f.read(struct.calcsize(TB_HEADER)))
+        if magic != TB_MAGIC or version != TB_VERSION:
+            raise ValueError(f'{path} is not a tablebase file for this version')
+        tables[tuple(counts)] = np.memmap(path, dtype=np.uint8, mode='r', offset=TB_HEADER_SIZE, shape=(n,))
+    return tables
+
+def tb_pieces(tables:dict) -> int:
+    # most pieces in any loaded table, positions with more can skip the lookup
+    return max((sum(counts) for counts in tables), default=0)
+
+
+# Generating
+
+_tables = {}
+
+def _solve(turn:bool, prev_move:int) -> int:
+    # value of the position on the board, from the tables or from its children
+    counts = _counts(B.bb)
+    table = _tables[counts]
+    ep = B.ep_file >= 0 # not in the tables, worked out every time
+    if not ep:
+        idx = tb_index(B.bb, turn, counts)
+        v = table[idx]
+        if v != UNKNOWN:
+            return v
+
+    values = []
+    caps, quiets = B.get_player_moves(turn, prev_move)
+    for mv in caps + quiets:
+        B.make_board_move(mv=mv)
+        if B.check_win():
+            values.append(1)
+        else:
+            values.append(_parent_value(_solve(not turn, mv)))
+        B.undo_board_move(mv=mv)
+    v = _best_value(values)
+    if not ep:
+        table[idx] = v
+    return v
+
+def _position_str(turn:bool, squares) -> str:
+    cells = ['.'] * (ROWS * COLS)
+    for t in range(6):
+        for sq in squares[t]:
+            cells[sq] = PIECE_CHARS[t]
+    rows = [''.join(cells[r * COLS:(r + 1) * COLS]) for r in range(ROWS)]
+    return '/'.join(rows) + (' w' if turn else ' b')
+
+def tb_generate(counts, directory=TB_DIR) -> int:
+    # solve every position of one signature and write its file, the tables it leads to have to be in directory
+    # returns the # of positions
+    sys.setrecursionlimit(10000) # _solve goes as deep as the game is long
+    _tables.clear()
+    _tables.update(tb_load(directory))
+    n = tb_size(counts)
+    table = bytearray([UNKNOWN]) * n
+    _tables[counts] = table
+    for idx in range(n):
+        if table[idx] != UNKNOWN:
+            continue
+        turn, squares = tb_squares(idx, counts)
+        occupied = [sq for type_squares in squares for sq in type_squares]
+        if len(set(occupied)) != len(occupied):
+            table[idx] = INVALID
+            continue
+        B.load_board_str(_position_str(turn, squares))
+        _solve(turn, None)
+
+    header = struct.pack(TB_HEADER, TB_MAGIC, TB_VERSION, *counts, n)
+    path = os.path.join(directory, tb_name(counts) + '.tb')
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header.ljust(TB_HEADER_SIZE, b'\0'))
+        f.write(table)
+    os.replace(path + '.tmp', path) # only whole tables show up in the directory
+    _tables.clear()
+    return n
+
+def signatures(pieces:int=TB_PIECES, white:int=TB_WHITE):
+    # every material signature with at most pieces on the board and white pieces for white, in the order they
+    # have to be generated: captures lead to fewer pieces, promotions to fewer white pawns
+    sigs = []
+    for n_white in range(1, white + 1):
+        for white_types in itertools.combinations_with_replacement(range(1, 6), n_white):
+            for n_black in range(1, pieces - n_white + 1):
+                counts = [n_black, 0, 0, 0, 0, 0]
+                for t in white_types:
+                    counts[t] += 1
+                sigs.append(tuple(counts))
+    return sorted(sigs, key=lambda counts: (sum(counts), counts[1]))
+
+def generate(pieces:int=TB_PIECES, white:int=TB_WHITE, workers:int=None, directory=TB_DIR, log=print):
+    # all the signatures, the ones with the same # of pieces and white pawns don't need each other
+    os.makedirs(directory, exist_ok=True)
+    done = set(tb_load(directory))
+    levels = {}
+    for counts in signatures(pieces, white):
+        if counts not in done:
+            levels.setdefault((sum(counts), counts[1]), []).append(counts)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for level in sorted(levels):
+            start = time.perf_counter()
+            sigs = levels[level]
+            sizes = list(pool.map(tb_generate, sigs, [directory] * len(sigs)))
+            log(f"{', '.join(tb_name(counts) for counts in sigs)}: {sum(sizes)} positions in {time.perf_counter() - start:.1f}s")
+
+def show(position:str, directory=TB_DIR):
+    from moves import move_str
+    tables = tb_load(directory)
+    turn = B.load_board_str(position)
+    v = tb_probe(tables, B.bb, turn)
+    if v is None:
+        print('not in the tablebases')
+        return
+    if v == DRAW:
+        print('draw')
+    else:
+        print(f"{'win' if v < LOSS else 'loss'} in {v if v < LOSS else v - LOSS} plies for {'white' if turn else 'black'}")
+    best = tb_best_move(tables, turn, None)
+    if best is not None:
+        print(f'best move {move_str(best[0])}')
+
+def main():
+    parser = argparse.ArgumentParser(description='generate the endgame tablebases')
+    parser.add_argument('-n', '--pieces', type=int, default=TB_PIECES)
+    parser.add_argument('-w', '--white', type=int, default=TB_WHITE)
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('-d', '--dir', default=TB_DIR)
+    parser.add_argument('-s', '--show', help='look up a position string')
+    args = parser.parse_args()
+    if args.show:
+        show(args.show, args.dir)
+        return
+    start = time.perf_counter()
+    generate(args.pieces, args.white, args.workers, args.dir)
+    print(f'done in {time.perf_counter() - start:.0f}s')
+
+if __name__ == "__main__":
+    main()
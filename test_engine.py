@@ -0,0 +1,75 @@
+"""
+test_engine.py
+A bad position command has to leave the engine on the position it had (python3 -m pytest test_engine.py)
+"""
+
+import os
+import pytest
+import board as B
+import engine
+from zobrist_hashing import zobrist_load
+
+START = 'ppppp/ppppp/ppppp/...../...../...../PPPPP/KNRB. w'
+
+@pytest.fixture
+def game(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__))) # zb.npy
+    engine.zb = zobrist_load()
+    engine.handle('position start knrb_')
+    return (B.board_to_str(engine.turn), engine.board_zb_hash)
+
+def _assert_unchanged(game):
+    position, board_zb_hash = game
+    assert B.board_to_str(engine.turn) == position
+    assert engine.board_zb_hash == board_zb_hash == B.calculate_zb_hash(engine.zb, engine.turn)
+    assert B.position.b_captured == 0 and B.position.w_captured == 0
+
+def test_start(game):
+    assert game[0] == START
+
+@pytest.mark.parametrize('line', [
+    'position board ppppp/ppppp/ppppp/...../...../...../PPPPP/KNRBx w', # not a piece
+    'position board ppppp/ppppp/ppppp/...../...../...../PPPPP/KKRB. w', # two kings
+    'position board ppppp/ppppp/...../...../PPPPP/KNRB. w', # too few rows
+    'position board ppppp/ppppp/ppppp/...../...../...../PPPPP/KNRB. x', # no side
+])
+def test_bad_board_string(game, line):
+    with pytest.raises(ValueError):
+        engine.handle(line)
+    _assert_unchanged(game)
+
+@pytest.mark.parametrize('rank', ['xyz', 'knrbb', 'knr__', 'knrb_q'])
+def test_bad_back_rank(game, rank):
+    with pytest.raises(ValueError):
+        engine.handle(f'position start {rank}')
+    _assert_unchanged(game)
+
+def test_bad_move(game):
+    # the first move is fine, the second isn't, neither may be played
+    with pytest.raises(ValueError):
+        engine.handle('position start knrb_ moves c7c6 z9z9')
+    _assert_unchanged(game)
+
+def test_search_after_error(game, capsys):
+    with pytest.raises(ValueError):
+        engine.handle('position start xyz')
+    engine._search(max_depth=2, time_limit=None, node_limit=None)
+    assert 'bestmove none' not in capsys.readouterr().out
+
+def test_load_str_keeps_position():
+    pos = B.Position()
+    pos.fill(white_back_rank='knrb ')
+    with pytest.raises(ValueError):
+        pos.load_str('ppppp/ppppp/ppppp/...../...../...../PPPPP/KNRBx w')
+    assert pos.to_str(True) == START
+
+@pytest.mark.parametrize('rows', [
+    'P..../ppppp/ppppp/...../...../...../.PPPP/KNRB.', # promotes on row 0
+    'ppppp/ppppp/ppppp/...../...../...../PPPP./KNRBP', # never on the back rank
+])
+def test_load_str_white_pawn_rows(rows):
+    pos = B.Position()
+    pos.fill(white_back_rank='knrb ')
+    with pytest.raises(ValueError):
+        pos.load_str(f'{rows} w')
+    assert pos.to_str(True) == START
@@ -0,0 +1,115 @@
+"""
+worker.py
+Runs the search in a background thread so the pygame loop keeps drawing and taking input while the AI thinks
+
+SearchWorker searches a copy of the game (position.Position.copy), so the board on screen never moves under the
+search. One job runs at a time, the search module (buffers, killers, limits) is shared by every search:
+1. search(), the AI move: the result comes back through poll() as a SearchResult with the job id
+2. ponder(), while the human thinks: plays the reply the transposition table expects (or none if it doesn't know)
+   and searches the position after it until cancelled, the result is thrown away but the table keeps what it found
+cancel() only sets the stop flag (search.stop, checked every CHECK_EVERY nodes), it doesn't wait for the thread.
+A job asked for while the old one is still stopping is started by a later poll(), so nothing here ever blocks.
+While a job runs the board module points at the copy (search.use_position), the thread that asked for it has to
+use its own Position (or the names it imported from board before) and not board.make_board_move and friends.
+With flush set a file backed table (zobrist_hashing.tt_load) is flushed by the thread after every search, the msync
+of the whole file takes tens of milliseconds and would otherwise hold up the caller.
+"""
+
+import queue
+import threading
+from typing import List, NamedTuple
+import search as S
+from zobrist_hashing import tt_lookup, tt_flush
+
+class SearchResult(NamedTuple):
+    job: int # the id search() returned
+    move: int # None if the game is over or there are no moves
+    depth: int
+    score: int
+
+class StopFlag:
+    # what search.stop expects, something with a value that is set to stop the search
+    def __init__(self):
+        self.value = 0
+
+class SearchWorker:
+    def __init__(self, zb=None, tt=None, flush: bool=False):
+        self.zb = zb
+        self.tt = tt
+        self.flush = flush # tt_flush the table after each search
+        self.results = queue.Queue()
+        self.stop = StopFlag()
+        self.thread = None
+        self.pending = None # (target, args) of a job waiting for the running one to stop
+        self.jobs = 0 # ids handed out so far
+
+    def search(self, position, prev_move: int, turn: bool, board_zb_hash=None, max_depth: int=S.MAX_PLY-1, time_limit: float=None) -> int:
+        # start searching for a move in position, stops whatever runs now, returns the job id of the result
+        self.jobs += 1
+        self._start(self._search, (self.jobs, position.copy(), prev_move, turn, board_zb_hash, max_depth, time_limit))
+        return self.jobs
+
+    def ponder(self, position, prev_move: int, turn: bool, board_zb_hash=None):
+        # search the expected reply to position (the opponent of the engine to move) until cancel()
+        self.jobs += 1
+        self._start(self._ponder, (position.copy(), prev_move, turn, board_zb_hash))
+
+    def cancel(self):
+        # stop the running job and forget the one waiting, the thread winds down on its own
+        self.pending = None
+        if self.thread is not None and self.thread.is_alive():
+            self.stop.value = 1
+
+    def poll(self) -> List[SearchResult]:
+        # results that came in since the last call, call it every frame (it also starts a waiting job)
+        if self.pending is not None and not (self.thread is not None and self.thread.is_alive()):
+            target, args = self.pending
+            self.pending = None
+            self.stop.value = 0
+            self.thread = threading.Thread(target=target, args=args, daemon=True)
+            self.thread.start()
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self, timeout: float=1.0):
+        # stop for good, waits (up to timeout) so the table isn't written to after this
+        self.cancel()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _start(self, target, args):
+        self.cancel()
+        self.pending = (target, args)
+        self.poll()
+
+    def _search(self, job: int, position, prev_move: int, turn: bool, board_zb_hash, max_depth: int, time_limit: float):
+        S.stop = self.stop
+        try:
+            mv = S.iterative_deepening(prev_move=prev_move, turn=turn, max_depth=max_depth, time_limit=time_limit, zb=self.zb, board_zb_hash=board_zb_hash, tt=self.tt, position=position)
+        finally:
+            S.stop = None
+        if not self.stop.value:
+            self.results.put(SearchResult(job=job, move=mv, depth=S.completed_depth, score=S.completed_score))
+        if self.flush and self.tt is not None:
+            tt_flush(self.tt) # save what the search found, after the result so the move isn't held up
+
+    def _ponder(self, position, prev_move: int, turn: bool, board_zb_hash):
+        # guess the reply from the table, a guess from another position could be any move so it is checked first
+        if self.tt is not None and board_zb_hash is not None:
+            entry = tt_lookup(self.tt, int(board_zb_hash))
+            if entry and entry.best_move and not position.check_win() and position.is_pseudo_legal(turn, prev_move, entry.best_move):
+                prev_move = entry.best_move
+                board_zb_hash = position.make_move(mv=prev_move, zb=self.zb, board_zb_hash=board_zb_hash)
+                turn = not turn
+        reporter = S.reporter
+        S.reporter = None # the console is for the moves that get played
+        S.stop = self.stop
+        try:
+            S.iterative_deepening(prev_move=prev_move, turn=turn, zb=self.zb, board_zb_hash=board_zb_hash, tt=self.tt, position=position)
+        finally:
+            S.stop = None
+            S.reporter = reporter
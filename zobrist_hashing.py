@@ -7,50 +7,232 @@ test functions implemented in the file
 -g: checks if tt (transposition table) file or zobrist file exists, 
     if one exists we do nothing, if not we generate them
 
-Max hash value is the max num of np.uint32
+Max hash value is the max num of np.uint64
 
-Value (evaluation heuristic? Or even if it is a win?) (10 bit)
-Type of value (flag, exact val, lower bound, upper bound) (2 bits)
-Best move/action (rs, cs, re, ce) (max val is 7) so we just need (3 bits each) (12) or just move class?
-Search depth (how far we went past this to verify how good it was) (4 bits)
 Identification of the position (the hashing) <= zobrist hashing, do XOR on all the positions of the pieces. Make a random number for every position a piece can be in. This means 6 pieces, 40 spots… 6 * 40 = 240 random numbers (not so bad)
+The zb array is (8, 40): rows 0-5 are the pieces (by zobrist_id), row 6 col 0 is XORed in when black is to move
+and row 7 cols 0-4 are the enpassant files (only hashed when a black pawn can take the pawn).
+
+The transposition table is two parallel np.uint64 arrays, one for the full key and one for the packed entry:
+Value (evaluation heuristic, stored + 32768) (16 bits)
+Search depth (how far we went past this to verify how good it was) (8 bits)
+Type of value (flag, exact val, lower bound, upper bound) (2 bits)
+Best move/action, packed move from moves.py (18 bits)
+Age, the search the entry was stored in (8 bits)
+
+16 + 8 + 2 + 18 + 8 = 52 bits for each entry (fits in a 64 bit int), so an entry costs 16 bytes with its key.
+Entries are grouped in buckets of TT_BUCKET, the first slots keep the deepest results and the last slot is always replaced.
+A packed entry of 0 means the slot is empty (a stored value is never 0 because of the offset).
+The key slot holds key ^ packed entry, so an entry half written by another process (lazy smp) just fails the key check.
 
-32 + 4 + 12 + 2 + 10 = 60 bit for each entry (fits in a 64 bit int)
+The table can also live in multiprocessing.shared_memory (tt_shared/tt_attach) so several processes search with one table.
+
+The table is saved as tt.bin and opened with np.memmap, so loading it costs nothing:
+header (TT_HEADER_SIZE bytes): magic, bucket size, # of entries, checksum of the zobrist keys, age
+then the key array and the data array (little endian np.uint64)
+The checksum ties the file to the zb.npy it was built with, hashes from other keys would never match.
 """
 
 import numpy as np
 import struct
-from moves import Move
+import hashlib
+from multiprocessing import shared_memory
+
+TT_SIZE_MB = 64 # size budget of the table, rounded down to a power of two number of entries
+TT_BUCKET = 4 # entries per bucket, must be a power of two
 
-TT_LEN = 5000000 # 2 million takes 50 mbs, 5 million takes 127 mbs (this is acceptable for me)
+VALUE_OFFSET = 1 << 15
+DEPTH_SHIFT = 16
+FLAG_SHIFT = 24
+MOVE_SHIFT = 26
+AGE_SHIFT = 44
+MOVE_BITS = 0x3FFFF
+
+TT_FILE = 'tt.bin'
+TT_MAGIC = b'NEGAMXTT'
+TT_HEADER = '<8sIIQQI' # magic, version, bucket size, # of entries, zobrist checksum, age
+TT_HEADER_SIZE = 64 # header is padded so the arrays start aligned
+TT_VERSION = 2 # 2: keys are stored xor the entry
 
 class TT_Entry:
-    # entry to the table, storing elements described above
-    def __init__(self, value:np.int16, depth:np.uint8, flag:np.uint8, best_move: Move):
+    # entry to the table, storing elements described above (decoded from the packed int by tt_lookup)
+    def __init__(self, value:np.int16, depth:np.uint8, flag:np.uint8, best_move: int):
         self.value = value # heuristic found for this state
         self.depth = depth # the depth where we found this 
         self.flag = flag # 0 = exact, 1 = lower, 2 = upper
-        self.best_move = best_move # simply the best move, we will need to update the piece references after verifying
-    
+        self.best_move = best_move # simply the best move, packed int (see moves.py)
 
-def tt_store(tt:np.typing.ArrayLike, key: np.uint32, value:int, depth:int, flag:int, best_move: Move):
-    i = key % len(tt)
-    tt[i] = TT_Entry(value=value, depth=depth, flag=flag, best_move=best_move)
-        
-def tt_lookup(tt:np.typing.ArrayLike, key: int) -> TT_Entry:
-    i = key % len(tt)
-    return tt[i]
+def tt_entries(size_mb:int) -> int:
+    # number of entries that fit the budget, 16 bytes each, rounded down to a power of two
+    n = max(TT_BUCKET, (size_mb * (1 << 20)) // 16)
+    return 1 << (n.bit_length() - 1)
+
+class TranspositionTable:
+    # parallel fixed width arrays, no python objects per entry
+    def __init__(self, size_mb:int=TT_SIZE_MB, keys=None, data=None):
+        if keys is None:
+            n = tt_entries(size_mb)
+            keys = np.zeros(shape=n, dtype=np.uint64)
+            data = np.zeros(shape=n, dtype=np.uint64)
+        self.keys = keys
+        self.data = data
+        self.bucket_mask = (len(keys) // TT_BUCKET) - 1
+        self.age = 0
+        self.fname = None # set when the table is backed by a file
+        self.shm = None # set when the table is in shared memory
+
+    def __len__(self):
+        return len(self.keys)
+
+def tt_new_search(tt:TranspositionTable):
+    # bump the age so entries from older searches get replaced first
+    tt.age = (tt.age + 1) & 0xFF
+
+def tt_pack(value:int, depth:int, flag:int, best_move:int, age:int) -> int:
+    return (value + VALUE_OFFSET) | (depth << DEPTH_SHIFT) | (flag << FLAG_SHIFT) | ((best_move & MOVE_BITS) << MOVE_SHIFT) | (age << AGE_SHIFT)
+
+def tt_unpack(data:int) -> TT_Entry:
+    return TT_Entry(value=(data & 0xFFFF) - VALUE_OFFSET,
+                    depth=(data >> DEPTH_SHIFT) & 0xFF,
+                    flag=(data >> FLAG_SHIFT) & 0x3,
+                    best_move=(data >> MOVE_SHIFT) & MOVE_BITS)
+
+def tt_store(tt:TranspositionTable, key: int, value:int, depth:int, flag:int, best_move: int):
+    key = int(key)
+    i = (key & tt.bucket_mask) * TT_BUCKET
+    keys = tt.keys[i:i + TT_BUCKET].tolist()
+    data = tt.data[i:i + TT_BUCKET].tolist()
+    packed = tt_pack(value, depth, flag, best_move or 0, tt.age)
+
+    # same position already stored, keep the deeper result unless it is from an older search
+    for j in range(TT_BUCKET):
+        if data[j] and keys[j] ^ data[j] == key:
+            old_depth = (data[j] >> DEPTH_SHIFT) & 0xFF
+            old_age = data[j] >> AGE_SHIFT
+            if depth >= old_depth or old_age != tt.age or flag == 0:
+                tt.keys[i + j] = key ^ packed
+                tt.data[i + j] = packed
+            return
 
-def tt_write(tt:np.typing.ArrayLike, fname='tt'):
-    # save current tt file
-    np.save(fname, tt)
+    # depth preferred slots, take an empty one or the shallowest (older searches count as shallower)
+    victim = -1
+    victim_depth = 1 << 16
+    for j in range(TT_BUCKET - 1):
+        if not data[j]:
+            victim = j
+            victim_depth = -1
+            break
+        old_depth = (data[j] >> DEPTH_SHIFT) & 0xFF
+        if data[j] >> AGE_SHIFT != tt.age:
+            old_depth -= 256
+        if old_depth < victim_depth:
+            victim = j
+            victim_depth = old_depth
+    if depth < victim_depth:
+        victim = TT_BUCKET - 1 # always replace slot
 
-def tt_load(fname='tt.npy') -> np.typing.ArrayLike:
-    return np.load(fname, allow_pickle=True)
+    tt.keys[i + victim] = key ^ packed
+    tt.data[i + victim] = packed
+
+def tt_lookup(tt:TranspositionTable, key: int) -> TT_Entry:
+    # returns None if the position isn't in the table, the full key is checked so collisions in the index don't match
+    key = int(key)
+    i = (key & tt.bucket_mask) * TT_BUCKET
+    keys = tt.keys[i:i + TT_BUCKET].tolist()
+    data = tt.data[i:i + TT_BUCKET].tolist()
+    for j in range(TT_BUCKET):
+        if data[j] and keys[j] ^ data[j] == key:
+            return tt_unpack(data[j])
+    return None
+
+def _tt_from_shm(shm:shared_memory.SharedMemory, n:int) -> TranspositionTable:
+    keys = np.ndarray(shape=n, dtype=np.uint64, buffer=shm.buf, offset=0)
+    data = np.ndarray(shape=n, dtype=np.uint64, buffer=shm.buf, offset=8 * n)
+    tt = TranspositionTable(keys=keys, data=data)
+    tt.shm = shm
+    return tt
+
+def tt_shared(size_mb:int=TT_SIZE_MB) -> TranspositionTable:
+    # an empty table in shared memory, other processes open it with tt_attach(tt.shm.name, len(tt))
+    # there are no locks, see the xor in tt_store/tt_lookup
+    n = tt_entries(size_mb)
+    shm = shared_memory.SharedMemory(create=True, size=16 * n)
+    tt = _tt_from_shm(shm, n)
+    tt.keys[:] = 0
+    tt.data[:] = 0
+    return tt
+
+def tt_attach(name:str, n:int) -> TranspositionTable:
+    # open a table made by tt_shared in another process
+    # meant for child processes (they share the creator's resource tracker), the creator unlinks it
+    return _tt_from_shm(shared_memory.SharedMemory(name=name), n)
+
+def tt_close(tt:TranspositionTable, unlink:bool=False):
+    # release a shared table, the creator unlinks it once every process is done with it
+    if tt.shm is None:
+        return
+    shm = tt.shm
+    tt.keys = tt.data = tt.shm = None # the arrays point into the buffer, drop them before closing
+    shm.close()
+    if unlink:
+        shm.unlink()
+
+def zobrist_checksum(zb:np.typing.ArrayLike) -> int:
+    # 64 bit fingerprint of the zobrist keys, stored in the tt header
+    return int.from_bytes(hashlib.blake2b(np.ascontiguousarray(zb).tobytes(), digest_size=8).digest(), 'little')
+
+def _tt_header(n:int, zb:np.typing.ArrayLike, age:int=0) -> bytes:
+    header = struct.pack(TT_HEADER, TT_MAGIC, TT_VERSION, TT_BUCKET, n, zobrist_checksum(zb), age)
+    return header.ljust(TT_HEADER_SIZE, b'\0')
+
+def tt_make_file(fname=TT_FILE, size_mb:int=TT_SIZE_MB, zb:np.typing.ArrayLike=None):
+    # create an empty table file bound to the zobrist keys
+    n = tt_entries(size_mb)
+    with open(fname, 'wb') as f:
+        f.write(_tt_header(n, zb))
+        f.truncate(TT_HEADER_SIZE + 16 * n) # sparse zeros, empty entries
+
+def tt_write(tt:TranspositionTable, fname=TT_FILE, zb:np.typing.ArrayLike=None):
+    # save an in memory table to a file that tt_load can map
+    with open(fname, 'wb') as f:
+        f.write(_tt_header(len(tt), zb, tt.age))
+        f.write(np.ascontiguousarray(tt.keys, dtype='<u8').tobytes())
+        f.write(np.ascontiguousarray(tt.data, dtype='<u8').tobytes())
+
+def tt_load(fname=TT_FILE, zb:np.typing.ArrayLike=None, readonly:bool=False) -> TranspositionTable:
+    # map the table file, nothing is read until the search touches it
+    # readonly maps copy on write: this process can still store entries but they never reach the file,
+    # so several engines can share one file
+    with open(fname, 'rb') as f:
+        magic, version, bucket, n, checksum, age = struct.unpack(TT_HEADER, f.read(struct.calcsize(TT_HEADER)))
+    if magic != TT_MAGIC or version != TT_VERSION or bucket != TT_BUCKET:
+        raise ValueError(f'{fname} is not a tt file for this version')
+    if zb is not None and checksum != zobrist_checksum(zb):
+        raise ValueError(f'{fname} was built with different zobrist keys')
+
+    mode = 'c' if readonly else 'r+'
+    keys = np.memmap(fname, dtype='<u8', mode=mode, offset=TT_HEADER_SIZE, shape=(n,))
+    data = np.memmap(fname, dtype='<u8', mode=mode, offset=TT_HEADER_SIZE + 8 * n, shape=(n,))
+    tt = TranspositionTable(keys=keys, data=data)
+    tt.age = age
+    if not readonly:
+        tt.fname = fname
+    return tt
+
+def tt_flush(tt:TranspositionTable):
+    # push searched results to the file, call every so often and on exit
+    if tt.fname is None:
+        return
+    tt.keys.flush()
+    tt.data.flush()
+    with open(tt.fname, 'r+b') as f:
+        f.seek(struct.calcsize(TT_HEADER) - 4)
+        f.write(struct.pack('<I', tt.age))
 
 def zobrist_make(fname='zb'):
     # ran only if zobrist file is not found when running this file
-    zobrist = np.random.randint(low=0, high=4294967295, size=(6, 40), dtype=np.uint32)
+    rng = np.random.default_rng()
+    zobrist = rng.integers(low=0, high=np.iinfo(np.uint64).max, size=(8, 40), dtype=np.uint64, endpoint=True)
     np.save(fname, zobrist)
 
 def zobrist_load(fname='zb.npy') -> np.typing.ArrayLike:
@@ -65,44 +247,64 @@ def main():
     if len(sys.argv) == 1:
         print('-g to generate a zobrist random number and tt storage file')
         print('-t to test zobrist hashing functions')
-        print('-n remove the current zb.npy & tt.npy files and regenerate them')
+        print('-n remove the current zb.npy & tt.bin files and regenerate them')
 
     if sys.argv[-1] == "-g":
-        if not isfile('tt.bin'):
-            tt = np.empty(shape=TT_LEN, dtype=object)
-            tt_write(tt=tt)
         if not isfile('zb.npy'):
             zobrist_make()
+        if not isfile(TT_FILE):
+            tt_make_file(zb=zobrist_load())
     
     if sys.argv[-1] == "-n":
-        tt = np.empty(shape=TT_LEN, dtype=object)
-        tt_write(tt=tt)
         zobrist_make()
+        tt_make_file(zb=zobrist_load()) # the old table is bound to the old keys
 
     if sys.argv[-1] == "-t":
-        from piece import Piece, white_pawn_evaluation, black_pawn_evaluation
-        from moves import white_pawn_moves, black_pawn_moves
+        from moves import encode_move, move_str
 
-        tt = tt_load()
-        tt_test = np.copy(tt)
         zb = zobrist_load()
-        p1 = Piece(0, 3, 1, True, 'wp', white_pawn_moves, white_pawn_evaluation)
-        p2 = Piece(1, 2, 2, False, 'bp', black_pawn_moves, black_pawn_evaluation)
-
-        test_mv = Move(piece=p1, rs=p1.r, cs=p1.c, re=2, ce=1, capture=None, promotion=False, enpassant=False, enpassant_cap=False)
-        for k in range(len(tt_test)):
+        tt_make_file(fname='tt_test.bin', size_mb=1, zb=zb)
+        tt_test = tt_load(fname='tt_test.bin', zb=zb)
+        test_mv = encode_move(rs=3, cs=1, re=2, ce=1)
+        for k in range(len(tt_test) // TT_BUCKET):
             tt_store(tt=tt_test, key=k, value=34, depth=5, flag=0, best_move=test_mv)
 
         entry = tt_lookup(tt=tt_test, key=0)
-        print(entry.best_move)
+        print(move_str(entry.best_move))
+
+        # a key with the same index but a different full key must miss
+        print(tt_lookup(tt=tt_test, key=len(tt_test) * 7) is None)
 
-        tt_write(tt=tt_test, fname='tt_test')
+        # a deeper entry survives a shallower one landing in the same bucket
+        bucket_stride = tt_test.bucket_mask + 1
+        tt_store(tt=tt_test, key=bucket_stride * 3, value=-20, depth=9, flag=1, best_move=test_mv)
+        tt_store(tt=tt_test, key=bucket_stride * 5, value=12, depth=1, flag=2, best_move=test_mv)
+        print(tt_lookup(tt=tt_test, key=bucket_stride * 3).value == -20)
 
-        tt_test_reload = tt_load(fname='tt_test.npy')
+        tt_flush(tt_test)
+
+        # read only reopen sees the flushed entries, its own stores stay private
+        tt_test_reload = tt_load(fname='tt_test.bin', zb=zb, readonly=True)
         entry_reload = tt_lookup(tt=tt_test_reload, key=0)
-        print(entry_reload.best_move)
+        print(move_str(entry_reload.best_move))
+        print(entry.best_move == entry_reload.best_move)
+        tt_store(tt=tt_test_reload, key=1, value=-5, depth=20, flag=0, best_move=test_mv)
+        print(tt_lookup(tt=tt_load(fname='tt_test.bin', zb=zb, readonly=True), key=1).value == 34)
+
+        # a file bound to other keys is refused
+        try:
+            tt_load(fname='tt_test.bin', zb=zb ^ np.uint64(1))
+            print(False)
+        except ValueError:
+            print(True)
 
-        print(entry.best_move is entry_reload.best_move)
+        # a shared table sees stores made through another handle to it
+        tt_sh = tt_shared(size_mb=1)
+        tt_other = tt_attach(tt_sh.shm.name, len(tt_sh))
+        tt_store(tt=tt_other, key=12345, value=7, depth=3, flag=0, best_move=test_mv)
+        print(tt_lookup(tt=tt_sh, key=12345).value == 7)
+        tt_close(tt_other)
+        tt_close(tt_sh, unlink=True)
 
 
 